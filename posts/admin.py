@@ -1,5 +1,6 @@
 from django.contrib import admin 
 from .models import Post, Group, Comment
+from . import search
  
  
 class PostAdmin(admin.ModelAdmin):
@@ -7,6 +8,12 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ("text",)
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
+
+    def get_search_results(self, request, queryset, search_term):
+        # ищем по обратному индексу, а не LIKE %q% по всей таблице
+        if not search_term.strip():
+            return queryset, False
+        return search.search(search_term, queryset), False
  
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "slug", "description")
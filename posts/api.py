@@ -0,0 +1,148 @@
+"""Read-only JSON API лент и NDJSON-выгрузка постов автора.
+
+Ленты отдаются теми же окнами keyset-пагинации и из того же кэша, что и
+HTML-страницы, но без рендеринга шаблонов. ETag строится из версии лент
+feed_cache: при совпадении If-None-Match ответ 304 отдаётся без запросов
+к постам. Выгрузка идёт потоком через .iterator(), поэтому все посты
+автора не загружаются в память разом.
+"""
+import hashlib
+import json
+from functools import partial
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_safe
+
+from . import feed_cache, media, timeline
+from .models import Follow, Group, Post, User
+from .pagination import paginate_feed
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+EXPORT_CHUNK = 500
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+def page_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return DEFAULT_LIMIT
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def feed_etag(request, *args, **kwargs):
+    # версия меняется при любом изменении постов, комментариев и групп
+    return hashlib.md5('{}|{}'.format(
+        feed_cache.version(), request.get_full_path()
+    ).encode()).hexdigest()
+
+
+def follow_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    # подписки не меняют версию лент: добавляем их число и последний id
+    follows = Follow.objects.filter(user=request.user).aggregate(Count('id'), Max('id'))
+    return hashlib.md5('{}|{}|{}|{}'.format(
+        feed_etag(request), request.user.pk, follows['id__count'], follows['id__max']
+    ).encode()).hexdigest()
+
+
+def post_data(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'image': post.image.url if post.image else None,
+        'comments': post.comments_count,
+    }
+
+
+def feed_response(paginator, page):
+    return JsonResponse(
+        {
+            'results': [post_data(post) for post in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        },
+        json_dumps_params=JSON_PARAMS,
+    )
+
+
+@require_safe
+@condition(etag_func=feed_etag)
+def index(request):
+    return feed_response(*feed_cache.cached_feed(
+        request, 'index', Post.objects.for_feed(), page_limit(request)
+    ))
+
+
+@require_safe
+@condition(etag_func=feed_etag)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(*feed_cache.cached_feed(
+        request, f'group:{group.pk}', group.group_posts.for_feed(), page_limit(request)
+    ))
+
+
+@require_safe
+@condition(etag_func=feed_etag)
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed_response(*feed_cache.cached_feed(
+        request, f'profile:{author.pk}', author.author_posts.for_feed(), page_limit(request)
+    ))
+
+
+@require_safe
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'detail': 'Нужна авторизация'}, status=401)
+    return _follow_index(request)
+
+
+@condition(etag_func=follow_etag)
+def _follow_index(request):
+    return feed_response(*paginate_feed(
+        request, partial(timeline.window, request.user), page_limit(request)
+    ))
+
+
+def export_lines(author):
+    rows = (
+        Post.objects.filter(author=author)
+        .order_by('-pub_date', '-pk')
+        .values('id', 'text', 'pub_date', 'group__slug', 'image', 'comments_count')
+        .iterator(chunk_size=EXPORT_CHUNK)
+    )
+    storage = media.storage()
+    for row in rows:
+        yield json.dumps(
+            {
+                'id': row['id'],
+                'text': row['text'],
+                'pub_date': row['pub_date'],
+                'author': author.username,
+                'group': row['group__slug'],
+                'image': storage.url(row['image']) if row['image'] else None,
+                'comments': row['comments_count'],
+            },
+            cls=DjangoJSONEncoder, **JSON_PARAMS,
+        ) + '\n'
+
+
+@require_safe
+@condition(etag_func=feed_etag)
+def export_posts(request, username):
+    author = get_object_or_404(User, username=username)
+    response = StreamingHttpResponse(
+        export_lines(author), content_type='application/x-ndjson; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{author.username}.ndjson"'
+    return response
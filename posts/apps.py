@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        # подключаем обработчики сигналов моделей
+        from . import signals  # noqa
+        # регистрируем задачи очереди
+        from . import tasks  # noqa
+        # проверка продакшен-настроек для manage.py check
+        from yatube import checks  # noqa
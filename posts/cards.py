@@ -0,0 +1,76 @@
+"""Кэш отрендеренных карточек постов.
+
+Карточка одинакова для всех пользователей, поэтому кэшируется по id поста
+и его версии. Версия меняется при сохранении поста и изменении его
+комментариев, а при изменении групп меняется общее поколение всех карточек.
+Кнопка «Редактировать» зависит от пользователя и вставляется после кэша.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from . import metrics, thumbnails
+from .versions import new_version
+
+GENERATION_KEY = 'post_card:generation'
+EDIT_SLOT = '<!--post-edit-->'
+
+
+def version_key(post_id):
+    return f'post_card:version:{post_id}'
+
+
+def bump(post_id):
+    cache.set(version_key(post_id), new_version(), None)
+
+
+def bump_all():
+    cache.set(GENERATION_KEY, new_version(), None)
+
+
+def _edit_link(post):
+    return format_html(
+        '<a class="btn btn-sm text-muted" href="{}" role="button">Редактировать</a>',
+        reverse('post_edit', args=[post.author.username, post.pk]),
+    )
+
+
+def render_cards(posts, user=None):
+    """HTML карточек постов: два обращения к кэшу на всю страницу."""
+    posts = list(posts)
+    versions = cache.get_many(
+        [GENERATION_KEY] + [version_key(post.pk) for post in posts]
+    )
+    missing = {
+        key: new_version() for key in
+        [GENERATION_KEY] + [version_key(post.pk) for post in posts]
+        if key not in versions
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+
+    generation = versions[GENERATION_KEY]
+    keys = [
+        'post_card:{}:{}:{}'.format(generation, post.pk, versions[version_key(post.pk)])
+        for post in posts
+    ]
+    cached = cache.get_many(keys)
+    metrics.count_cache(hits=len(cached), misses=len(keys) - len(cached))
+    thumbnails.prefetch([post for key, post in zip(keys, posts) if key not in cached])
+    rendered = {}
+    cards = []
+    for key, post in zip(keys, posts):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string('item/post_card.html', {'post': post})
+            rendered[key] = html
+        edit = _edit_link(post) if user is not None and user.pk == post.author_id else ''
+        cards.append(mark_safe(html.replace(EDIT_SLOT, edit)))
+    if rendered:
+        cache.set_many(rendered, getattr(settings, 'POST_CARD_CACHE_TIMEOUT', None))
+    return cards
@@ -0,0 +1,118 @@
+"""Дайджесты новых постов для подписчиков.
+
+new_post ничего не рассылает. Раз в DIGEST_WINDOW manage.py send_digests
+собирает посты за окно с прошлой рассылки и отправляет каждому подписчику
+их авторов одно письмо со всеми новыми постами. Подписчики идут пачками
+по DIGEST_BATCH_SIZE в порядке id: на пачку - три запроса (id подписчиков,
+их подписки и адреса), один раз загруженный шаблон и одно соединение
+с почтовым бэкендом, так что автор с десятками тысяч подписчиков стоит
+столько же запросов на пачку, сколько и автор с одним. Прогресс пачек сохраняется в DigestRun, прерванная
+рассылка продолжается без повторных писем.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import DigestRun, Follow, Post, User
+
+
+def window():
+    return timedelta(seconds=getattr(settings, 'DIGEST_WINDOW', 24 * 60 * 60))
+
+
+def batch_size():
+    return getattr(settings, 'DIGEST_BATCH_SIZE', 500)
+
+
+def posts_per_author():
+    return getattr(settings, 'DIGEST_POSTS_PER_AUTHOR', 5)
+
+
+def current_run(until=None):
+    """Незаконченная рассылка или новая - с конца предыдущей до until."""
+    run = DigestRun.objects.filter(finished__isnull=True).order_by('pk').first()
+    if run is not None:
+        return run
+    until = until or timezone.now()
+    last = DigestRun.objects.exclude(finished=None).order_by('-until').first()
+    since = last.until if last is not None else until - window()
+    return DigestRun.objects.create(since=since, until=until)
+
+
+def window_posts(run, domain):
+    """Посты окна со ссылками по авторам, не больше posts_per_author() у каждого."""
+    posts = Post.objects.filter(
+        pub_date__gt=run.since, pub_date__lte=run.until
+    ).select_related('author', 'group').order_by('author_id', '-pub_date')
+    by_author = defaultdict(list)
+    for post in posts.iterator():
+        if len(by_author[post.author_id]) < posts_per_author():
+            url = 'http://{}{}'.format(
+                domain, reverse('post', args=[post.author.username, post.pk])
+            )
+            by_author[post.author_id].append((post, url))
+    return by_author
+
+
+def follower_batches(run, author_ids):
+    """Пачки (id подписчика, [id авторов]) после run.last_user."""
+    size = batch_size()
+    cursor = run.last_user
+    while True:
+        user_ids = list(
+            Follow.objects.filter(author_id__in=author_ids, user_id__gt=cursor)
+            .order_by('user_id').values_list('user_id', flat=True).distinct()[:size]
+        )
+        if not user_ids:
+            return
+        follows = defaultdict(list)
+        rows = Follow.objects.filter(
+            user_id__in=user_ids, author_id__in=author_ids
+        ).values_list('user_id', 'author_id')
+        for user_id, author_id in rows:
+            follows[user_id].append(author_id)
+        yield sorted(follows.items())
+        cursor = user_ids[-1]
+
+
+def build_messages(template, batch, by_author):
+    users = User.objects.filter(pk__in=[user_id for user_id, _ in batch]).exclude(email='')
+    addresses = dict(users.values_list('pk', 'email'))
+    subject = 'Новые записи ваших авторов'
+    messages = []
+    for user_id, author_ids in batch:
+        if user_id not in addresses:
+            continue
+        posts = sorted(
+            (entry for author_id in author_ids for entry in by_author[author_id]),
+            key=lambda entry: entry[0].pub_date, reverse=True,
+        )
+        body = template.render({'posts': posts})
+        messages.append(EmailMessage(subject, body, to=[addresses[user_id]]))
+    return messages
+
+
+def send(until=None):
+    """Рассылает дайджесты за окно до until; возвращает число писем."""
+    run = current_run(until)
+    by_author = window_posts(run, Site.objects.get_current().domain)
+    if by_author:
+        template = get_template('emails/digest.txt')
+        for batch in follower_batches(run, list(by_author)):
+            messages = build_messages(template, batch, by_author)
+            if messages:
+                # одно соединение на пачку: файловый бэкенд пишет её одним файлом
+                with get_connection() as connection:
+                    connection.send_messages(messages)
+            run.last_user = batch[-1][0]
+            run.sent += len(messages)
+            run.save(update_fields=['last_user', 'sent'])
+    run.finished = timezone.now()
+    run.save(update_fields=['finished'])
+    return run.sent
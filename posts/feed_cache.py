@@ -0,0 +1,103 @@
+"""Кэш страниц лент с версией содержимого.
+
+Ключ страницы включает имя ленты, курсор и текущую версию содержимого.
+Любое изменение постов, комментариев и групп меняет версию, поэтому
+старые записи просто перестают читаться, а не живут до истечения TTL.
+Версия лежит в том же кэше, что и страницы: с общим бэкендом (file, db,
+memcached, redis) её смена в одном воркере видна всем остальным.
+"""
+import hashlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .pagination import build_page, paginate_feed
+from .versions import new_version
+
+VERSION_KEY = 'feed:version'
+HITS_KEY = 'feed:hits'
+MISSES_KEY = 'feed:misses'
+ATOMIC_INCR_BACKENDS = ('MemcachedCache', 'PyLibMCCache', 'RedisCache')
+
+# счётчики текущего процесса, не зависят от бэкенда кэша
+local_stats = Counter()
+
+
+def version():
+    value = cache.get(VERSION_KEY)
+    if value is None:
+        cache.add(VERSION_KEY, new_version(), None)
+        value = cache.get(VERSION_KEY)
+    return value
+
+
+def bump_version():
+    cache.set(VERSION_KEY, new_version(), None)
+
+
+def shared_counters():
+    # incr() атомарен только у memcached и redis; у file и db бэкендов это
+    # get и set, то есть запись на каждое чтение ленты и потерянные счёты
+    backend = settings.CACHES['default']['BACKEND']
+    return backend.rsplit('.', 1)[-1] in ATOMIC_INCR_BACKENDS
+
+
+def _count(key):
+    local_stats[key] += 1
+    metrics.count_cache(hits=int(key == HITS_KEY), misses=int(key == MISSES_KEY))
+    if not shared_counters():
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def stats():
+    """Попадания и промахи: общие для всех воркеров или текущего процесса."""
+    if shared_counters():
+        hits = cache.get(HITS_KEY, 0)
+        misses = cache.get(MISSES_KEY, 0)
+    else:
+        hits, misses = local_stats[HITS_KEY], local_stats[MISSES_KEY]
+    total = hits + misses
+    return {
+        'version': cache.get(VERSION_KEY),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+        'shared': shared_counters(),
+    }
+
+
+def reset_stats():
+    local_stats.clear()
+    if shared_counters():
+        cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def page_key(feed, request, per_page):
+    cursor = '{}|{}'.format(request.GET.get('after', ''), request.GET.get('before', ''))
+    return 'feed:{}:{}:{}:{}'.format(
+        feed, version(), per_page, hashlib.md5(cursor.encode()).hexdigest()
+    )
+
+
+def cached_feed(request, feed, queryset, per_page):
+    """paginate_feed с кэшированием окна постов под ключом ленты."""
+    key = page_key(feed, request, per_page)
+    entry = cache.get(key)
+    if entry is not None:
+        _count(HITS_KEY)
+        return build_page(*entry)
+    _count(MISSES_KEY)
+    paginator, page = paginate_feed(request, queryset, per_page)
+    cache.set(
+        key,
+        (list(page.object_list), per_page, page.next_cursor, page.previous_cursor),
+        getattr(settings, 'FEED_CACHE_TIMEOUT', None),
+    )
+    return paginator, page
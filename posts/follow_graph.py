@@ -0,0 +1,183 @@
+"""Граф подписок: пакетные подписки и компактный список смежности в кэше.
+
+Для каждого пользователя в кэше лежат два отсортированных массива id
+(array('i')): на кого он подписан и кто подписан на него. Вопросы «подписан
+ли X на Y», «подписчики Y» и «взаимные подписки» решаются по ним бинарным
+поиском и слиянием, без запросов к БД. Запись сбрасывает только массивы
+затронутых пользователей; bulk_create мимо follow() (seed_data) сбрасывает
+весь граф через reset().
+"""
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from . import freshness, jobs, timeline
+from .models import Follow, User, UserStats
+from .versions import new_version
+from .writes import write_transaction
+
+GENERATION_KEY = 'follow_graph:generation'
+FOLLOWING = 'out'
+FOLLOWERS = 'in'
+
+
+def reset():
+    cache.set(GENERATION_KEY, new_version(), None)
+
+
+def _generation():
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, new_version(), None)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+
+def _key(generation, direction, user_id):
+    return f'follow_graph:{generation}:{direction}:{user_id}'
+
+
+def _adjacency(direction, user_ids):
+    """Массивы смежности для user_ids: одно обращение к кэшу, промахи - одним запросом."""
+    generation = _generation()
+    keys = {user_id: _key(generation, direction, user_id) for user_id in user_ids}
+    cached = cache.get_many(keys.values())
+    result = {user_id: cached[key] for user_id, key in keys.items() if key in cached}
+    missing = [user_id for user_id in user_ids if user_id not in result]
+    if missing:
+        if direction == FOLLOWING:
+            own, other = 'user_id', 'author_id'
+        else:
+            own, other = 'author_id', 'user_id'
+        loaded = {user_id: array('i') for user_id in missing}
+        rows = Follow.objects.filter(**{f'{own}__in': missing}).order_by(own, other)
+        for user_id, other_id in rows.values_list(own, other).iterator():
+            loaded[user_id].append(other_id)
+        cache.set_many({keys[user_id]: ids for user_id, ids in loaded.items()}, None)
+        result.update(loaded)
+    return result
+
+
+def _forget(user_id, author_ids):
+    generation = _generation()
+    cache.delete_many(
+        [_key(generation, FOLLOWING, user_id)]
+        + [_key(generation, FOLLOWERS, author_id) for author_id in author_ids]
+    )
+
+
+def following(user_id):
+    """Отсортированные id авторов, на которых подписан user_id."""
+    return _adjacency(FOLLOWING, [user_id])[user_id]
+
+
+def followers(user_id):
+    """Отсортированные id подписчиков user_id."""
+    return _adjacency(FOLLOWERS, [user_id])[user_id]
+
+
+def follows(user_id, author_id):
+    ids = following(user_id)
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def mutual(user_id):
+    """id пользователей, с которыми user_id подписан друг на друга."""
+    outgoing = following(user_id)
+    incoming = followers(user_id)
+    result = []
+    i = j = 0
+    while i < len(outgoing) and j < len(incoming):
+        if outgoing[i] == incoming[j]:
+            result.append(outgoing[i])
+            i += 1
+            j += 1
+        elif outgoing[i] < incoming[j]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def followed(user_id, author_ids):
+    """Производные данные новых подписок: счётчики, ленты, кэши."""
+    UserStats.objects.bump(user_id, following_count=len(author_ids))
+    UserStats.objects.bump_many(author_ids, followers_count=1)
+    timeline.backfill_many(user_id, author_ids)
+    _changed(user_id, author_ids)
+
+
+def unfollowed(user_id, author_ids):
+    UserStats.objects.bump(user_id, following_count=-len(author_ids))
+    UserStats.objects.bump_many(author_ids, followers_count=-1)
+    timeline.prune_many(user_id, author_ids)
+    # посты, которые подмешивались при чтении, теперь должны быть в лентах
+    for author_id in timeline.crossed_below_limit(author_ids):
+        jobs.enqueue('timeline.restore_fanout', author_id=author_id)
+    _changed(user_id, author_ids)
+
+
+def _changed(user_id, author_ids):
+    _forget(user_id, author_ids)
+    usernames = User.objects.filter(pk__in=[user_id, *author_ids]).values_list(
+        'username', flat=True
+    )
+    freshness.touch(*(f'profile:{username}' for username in usernames))
+
+
+def _lock(user_id):
+    """Подписки и отписки одного пользователя выполняются по очереди.
+
+    Блокируется строка его счётчиков, на SQLite write_transaction() сама
+    берёт блокировку записи. Иначе параллельная подписка на того же автора
+    прошла бы проверку existing дважды и дважды попала бы в счётчики.
+    """
+    rows = UserStats.objects.select_for_update().filter(user_id=user_id)
+    if not rows.exists():
+        # строки ещё нет: создаём и блокируем уже её
+        UserStats.objects.rebuild(user_id)
+        rows.exists()
+
+
+def follow(user_id, author_ids):
+    """Подписывает user_id на author_ids; повторные подписки пропускаются.
+
+    Возвращает id авторов, подписка на которых появилась.
+    """
+    author_ids = set(author_ids) - {user_id}
+    if not author_ids:
+        return []
+    with write_transaction():
+        _lock(user_id)
+        existing = Follow.objects.filter(user_id=user_id, author_id__in=author_ids)
+        new = sorted(author_ids - set(existing.values_list('author_id', flat=True)))
+        if not new:
+            return []
+        # bulk_create не вызывает post_save: производные данные считает followed()
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id) for author_id in new],
+            batch_size=timeline.BATCH_SIZE,
+        )
+        followed(user_id, new)
+    return new
+
+
+def unfollow(user_id, author_ids):
+    """Отписывает user_id от author_ids; отсутствующие подписки пропускаются.
+
+    Возвращает id авторов, подписка на которых была удалена.
+    """
+    author_ids = set(author_ids)
+    if not author_ids:
+        return []
+    with write_transaction():
+        _lock(user_id)
+        rows = Follow.objects.filter(user_id=user_id, author_id__in=author_ids)
+        removed = sorted(rows.values_list('author_id', flat=True))
+        if not removed:
+            return []
+        # производные данные считает unfollowed() из post_delete
+        rows.delete()
+    return removed
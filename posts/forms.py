@@ -1,5 +1,7 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 from .models import Post, Comment
+from . import images
  
 
 class PostForm(ModelForm):
@@ -15,6 +17,25 @@ class PostForm(ModelForm):
             'group': 'Группа',
             'image': 'Картинка',
         }
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # новая загрузка; оставленная или снятая картинка проходит как есть
+        if not isinstance(image, UploadedFile):
+            return image
+        self.ingested = images.ingest(image)
+        return self.ingested.file
+
+    def save(self, commit=True):
+        ingested = getattr(self, 'ingested', None)
+        if ingested is not None:
+            self.instance.image_width = ingested.width
+            self.instance.image_height = ingested.height
+            self.instance.image_size = ingested.size
+        elif not self.instance.image:
+            self.instance.image_width = self.instance.image_height = None
+            self.instance.image_size = None
+        return super().save(commit)
  
 form = PostForm()
 
@@ -0,0 +1,81 @@
+"""Условные GET (ETag / Last-Modified) для лент и страницы поста.
+
+Last-Modified страницы - самое позднее Post.updated в её пределах: оно
+меняется при правке поста и при изменении его комментариев, а MAX читается
+из индекса. Удаление поста, правка групп и подписки не оставляют следа в
+строках постов, поэтому signals отмечают их временем в кэше по областям
+(touch), и оно тоже участвует в Last-Modified. ETag добавляет к этому
+пользователя и курсор страницы, а у страницы поста - CSRF-токен из формы
+комментария. Всё считается до основных запросов и рендеринга, и неизменная
+страница сразу получает 304.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .models import Post
+
+ALL = 'all'
+# правка поста могла перенести его в другую группу
+GROUPS = 'groups'
+
+
+def marker_key(scope):
+    return f'freshness:{scope}'
+
+
+def touch(*scopes):
+    now = timezone.now()
+    cache.set_many({marker_key(scope): now for scope in scopes}, None)
+
+
+def last_modified(queryset, *scopes):
+    moments = list(cache.get_many([marker_key(scope) for scope in (ALL,) + scopes]).values())
+    moments.append(queryset.order_by().aggregate(latest=Max('updated'))['latest'])
+    moments = [moment for moment in moments if moment is not None]
+    return max(moments) if moments else None
+
+
+def _state(request, name, queryset, *scopes):
+    # condition() спрашивает ETag и Last-Modified по отдельности: считаем один раз
+    if not hasattr(request, '_freshness'):
+        moment = last_modified(queryset, *scopes)
+        user = request.user.pk if request.user.is_authenticated else 0
+        etag = hashlib.md5('{}|{}|{}|{}'.format(
+            name, user, moment.isoformat() if moment else '', request.GET.urlencode()
+        ).encode()).hexdigest()
+        request._freshness = (etag, moment)
+    return request._freshness
+
+
+def index_state(request):
+    return _state(request, 'index', Post.objects.all(), 'index')
+
+
+def group_state(request, slug):
+    queryset = Post.objects.filter(group__slug=slug)
+    return _state(request, f'group:{slug}', queryset, GROUPS, f'group:{slug}')
+
+
+def profile_state(request, username):
+    queryset = Post.objects.filter(author__username=username)
+    return _state(request, f'profile:{username}', queryset, f'profile:{username}')
+
+
+def post_state(request, username, post_id):
+    # на странице поста ещё и счётчики автора: их меняет область профиля
+    # токен в форме комментария меняется при входе пользователя
+    name = 'post:{}:{}'.format(post_id, request.META.get('CSRF_COOKIE', ''))
+    queryset = Post.objects.filter(pk=post_id)
+    return _state(request, name, queryset, f'profile:{username}')
+
+
+def conditional(state):
+    """condition() с ETag и Last-Modified из одной функции state."""
+    return condition(
+        etag_func=lambda request, *args, **kwargs: state(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: state(request, *args, **kwargs)[1],
+    )
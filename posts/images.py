@@ -0,0 +1,107 @@
+"""Приём картинок постов при загрузке.
+
+PostForm прогоняет каждую новую картинку через ingest(): проверяет, что это
+изображение разумного размера, поворачивает по EXIF Orientation, уменьшает
+до POST_IMAGE_MAX_SIZE и перекодирует в POST_IMAGE_FORMAT (WebP) без
+метаданных. Если Pillow собран без WebP, сохраняется JPEG. Ширина, высота
+и размер файла записываются в Post, поэтому ни ленты, ни sorl больше не
+декодируют исходные многомегабайтные фотографии.
+"""
+import os
+from collections import namedtuple
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+FALLBACK_FORMAT = 'JPEG'
+EXTENSIONS = {'WEBP': '.webp', 'JPEG': '.jpg'}
+
+Ingested = namedtuple('Ingested', 'file width height size')
+
+
+def max_size():
+    return getattr(settings, 'POST_IMAGE_MAX_SIZE', (1920, 1920))
+
+
+def max_pixels():
+    # исходники больше этого не декодируем вовсе: защита от «бомб»
+    return getattr(settings, 'POST_IMAGE_MAX_PIXELS', 50 * 1000 * 1000)
+
+
+def max_upload():
+    return getattr(settings, 'POST_IMAGE_MAX_UPLOAD', 20 * 1024 * 1024)
+
+
+def quality():
+    return getattr(settings, 'POST_IMAGE_QUALITY', 82)
+
+
+def target_format():
+    name = getattr(settings, 'POST_IMAGE_FORMAT', 'WEBP')
+    if name == 'WEBP' and not features.check('webp'):
+        return FALLBACK_FORMAT
+    return name
+
+
+def open_image(upload):
+    if upload.size > max_upload():
+        raise ValidationError(
+            'Файл больше %(limit)s МБ.', code='too_large',
+            params={'limit': max_upload() // (1024 * 1024)},
+        )
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+        if image.width * image.height > max_pixels():
+            raise ValidationError(
+                'Слишком большое изображение: %(width)s×%(height)s.', code='too_many_pixels',
+                params={'width': image.width, 'height': image.height},
+            )
+        image.load()
+    except ValidationError:
+        raise
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise ValidationError(
+            'Загрузите правильное изображение. Файл, который вы загрузили, '
+            'поврежден или не является изображением.', code='invalid_image',
+        )
+    return image
+
+
+def encode(image, image_format):
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(max_size(), Image.LANCZOS)
+    has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    if image_format == 'JPEG' or not has_alpha:
+        if has_alpha:
+            # у JPEG нет прозрачности: кладём картинку на белый фон
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+    else:
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    # метаданные (EXIF, комментарии) в новый файл не передаются
+    options = {'quality': quality()}
+    if image_format == 'JPEG':
+        options.update(optimize=True, progressive=True)
+    else:
+        options.update(method=4)
+    image.save(buffer, image_format, **options)
+    return image, buffer.getvalue()
+
+
+def ingest(upload):
+    """Проверенная, уменьшенная и перекодированная копия загруженной картинки."""
+    image = open_image(upload)
+    image_format = target_format()
+    image, data = encode(image, image_format)
+    base = os.path.splitext(os.path.basename(upload.name))[0] or 'image'
+    name = base + EXTENSIONS.get(image_format, '.' + image_format.lower())
+    return Ingested(ContentFile(data, name=name), image.width, image.height, len(data))
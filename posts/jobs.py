@@ -0,0 +1,175 @@
+"""Очередь фоновых задач в таблице БД.
+
+Побочные действия записи постов (раскладка по лентам, поиск, миниатюры)
+не выполняются в запросе: enqueue() кладёт строку Job в ту же транзакцию,
+что и сам пост, а manage.py run_jobs разбирает очередь пулом потоков.
+Неудачная задача повторяется с растущей паузой, пока не кончатся попытки;
+JOB_QUEUE_CONCURRENCY ограничивает число одновременно выполняемых задач
+одного имени на все воркеры. У каждой задачи сохраняется время выполнения,
+stats() сводит его по именам.
+
+С JOB_QUEUE_MODE = 'sync' задачи выполняются сразу в enqueue() (разработка и тесты, см. yatube/settings/base.py).
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Avg, Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def mode():
+    return getattr(settings, 'JOB_QUEUE_MODE', 'db')
+
+
+def max_attempts():
+    return getattr(settings, 'JOB_QUEUE_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    # 10 с, 20 с, 40 с...
+    return getattr(settings, 'JOB_QUEUE_RETRY_DELAY', 10) * 2 ** (attempts - 1)
+
+
+def concurrency():
+    return getattr(settings, 'JOB_QUEUE_CONCURRENCY', {})
+
+
+def task(name):
+    """Регистрирует функцию как задачу очереди под именем name."""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def job_key(task, payload):
+    return hashlib.md5(f'{task}|{payload}'.encode()).hexdigest()
+
+
+def enqueue(_task, **kwargs):
+    """Ставит задачу _task(**kwargs) в очередь; аргументы должны быть JSON.
+
+    Подчёркивание в имени не даёт ему совпасть с аргументом задачи
+    (name=, task=), а синтаксис «/» появился только в Python 3.8.
+    """
+    if _task not in TASKS:
+        raise KeyError(f'Неизвестная задача {_task}')
+    if mode() == 'sync':
+        # как и в run(): упавшая задача записывается в лог, а не роняет запрос
+        try:
+            TASKS[_task](**kwargs)
+        except Exception:
+            logger.exception('Задача %s не выполнена', _task)
+        return None
+    payload = json.dumps(kwargs, sort_keys=True)
+    key = job_key(_task, payload)
+    if Job.objects.filter(key=key, status=Job.QUEUED).exists():
+        return None
+    return Job.objects.create(name=_task, payload=payload, key=key, run_at=timezone.now())
+
+
+def worker_name():
+    return '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])[:64]
+
+
+def claim(worker, limit):
+    """Забирает до limit готовых задач за воркером worker."""
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    running = dict(
+        Job.objects.filter(status=Job.RUNNING).values_list('name')
+        .annotate(count=Count('id')).order_by()
+    )
+    ready = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    limits = concurrency()
+    # задачи, упёршиеся в свой предел, не берём совсем
+    full = [name for name, limit in limits.items() if running.get(name, 0) >= limit]
+    if full:
+        ready = ready.exclude(name__in=full)
+    chosen = []
+    taken = dict(running)
+    for pk, name in ready.values_list('pk', 'name')[:limit * 4]:
+        if name in limits and taken.get(name, 0) >= limits[name]:
+            continue
+        taken[name] = taken.get(name, 0) + 1
+        chosen.append(pk)
+        if len(chosen) == limit:
+            break
+    if not chosen:
+        return []
+    # UPDATE с проверкой статуса: задачу, которую успел взять другой
+    # воркер, второй раз не получим
+    Job.objects.filter(pk__in=chosen, status=Job.QUEUED).update(
+        status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1
+    )
+    return list(Job.objects.filter(pk__in=chosen, status=Job.RUNNING, locked_by=worker))
+
+
+def run(job):
+    """Выполняет задачу и записывает итог, время и, при ошибке, повтор."""
+    started = time.perf_counter()
+    try:
+        # payload - аргументы задачи, job.name в них не попадает
+        TASKS[job.name](**json.loads(job.payload))
+    except Exception:
+        duration = time.perf_counter() - started
+        logger.exception('Задача %s #%s не выполнена', job.name, job.pk)
+        now = timezone.now()
+        if job.attempts < max_attempts():
+            delay = timedelta(seconds=retry_delay(job.attempts))
+            changes = {'status': Job.QUEUED, 'run_at': now + delay}
+        else:
+            changes = {'status': Job.FAILED, 'finished': now}
+        Job.objects.filter(pk=job.pk).update(
+            duration=duration, last_error=traceback.format_exc(), **changes
+        )
+        return False
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.DONE, finished=timezone.now(), duration=time.perf_counter() - started
+    )
+    return True
+
+
+def requeue_stale(timeout):
+    """Возвращает в очередь задачи воркеров, которые упали посреди работы."""
+    return Job.objects.filter(
+        status=Job.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status=Job.QUEUED, locked_by='')
+
+
+def purge(older_than):
+    """Удаляет выполненные задачи старше older_than секунд."""
+    deleted, _ = Job.objects.filter(
+        status=Job.DONE, finished__lt=timezone.now() - timedelta(seconds=older_than)
+    ).delete()
+    return deleted
+
+
+def stats():
+    """Сводка по именам задач: сколько в каком статусе и время выполнения."""
+    return list(
+        Job.objects.values('name').annotate(
+            queued=Count('id', filter=Q(status=Job.QUEUED)),
+            running=Count('id', filter=Q(status=Job.RUNNING)),
+            done=Count('id', filter=Q(status=Job.DONE)),
+            failed=Count('id', filter=Q(status=Job.FAILED)),
+            retries=Sum('attempts') - Count('id', filter=Q(attempts__gt=0)),
+            avg_duration=Avg('duration'),
+            max_duration=Max('duration'),
+        ).order_by('name')
+    )
@@ -0,0 +1,93 @@
+import multiprocessing
+import random
+import statistics
+import time
+
+from django.core.cache import cache, caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from posts import feed_cache
+from posts.models import Group, Post, User
+
+from .bench_views import percentile
+
+
+def run_worker(urls, requests, seed, write_every, author_id):
+    client = Client()
+    rng = random.Random(seed)
+    feed_cache.local_stats.clear()
+    latencies = []
+    for number in range(1, requests + 1):
+        if write_every and number % write_every == 0:
+            Post.objects.create(text=f'bench {seed} {number}', author_id=author_id)
+        url = rng.choice(urls)
+        started = time.perf_counter()
+        client.get(url)
+        latencies.append(time.perf_counter() - started)
+    connections.close_all()
+    return (
+        latencies,
+        feed_cache.local_stats[feed_cache.HITS_KEY],
+        feed_cache.local_stats[feed_cache.MISSES_KEY],
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает долю попаданий и задержку кэша лент при одном и '
+        'нескольких процессах-воркерах с текущим бэкендом CACHES'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+        parser.add_argument(
+            '--requests', type=int, default=400,
+            help='общее число запросов, делится между воркерами'
+        )
+        parser.add_argument(
+            '--write-every', type=int, default=0,
+            help='каждый N-й запрос воркера создаёт пост (сброс версии)'
+        )
+
+    def handle(self, *args, **options):
+        author = User.objects.first()
+        if author is None:
+            raise CommandError('В базе нет данных: сначала заполните её постами')
+        urls = [reverse('index')]
+        urls += [
+            reverse('group_posts', kwargs={'slug': slug})
+            for slug in Group.objects.values_list('slug', flat=True)[:20]
+        ]
+        urls += [
+            reverse('profile', kwargs={'username': username})
+            for username in User.objects.values_list('username', flat=True)[:20]
+        ]
+        self.stdout.write(f"бэкенд: {caches['default'].__class__.__name__}, адресов: {len(urls)}")
+
+        context = multiprocessing.get_context('fork')
+        for workers in options['workers']:
+            cache.clear()
+            connections.close_all()
+            per_worker = max(1, options['requests'] // workers)
+            jobs = [
+                (urls, per_worker, seed, options['write_every'], author.pk)
+                for seed in range(workers)
+            ]
+            started = time.perf_counter()
+            with context.Pool(workers) as pool:
+                results = pool.starmap(run_worker, jobs)
+            elapsed = time.perf_counter() - started
+
+            latencies = [value for result in results for value in result[0]]
+            hits = sum(result[1] for result in results)
+            misses = sum(result[2] for result in results)
+            self.stdout.write(
+                f'воркеров: {workers:>2}  запросов: {len(latencies)}  '
+                f'попаданий: {hits / max(1, hits + misses):.1%}  '
+                f'p50: {statistics.median(latencies) * 1000:.1f} мс  '
+                f'p95: {percentile(latencies, 0.95) * 1000:.1f} мс  '
+                f'{len(latencies) / elapsed:.0f} запр/с'
+            )
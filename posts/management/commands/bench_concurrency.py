@@ -0,0 +1,193 @@
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Comment, Post, User
+from posts.pagination import encode_cursor
+
+from .bench_views import current_commit, percentile
+
+# по этой метке записи бенчмарка удаляются после прогона
+MARK = 'bench_concurrency'
+
+
+def reader(reader_id, post_urls, cursors, deadline, cold, results):
+    connections.close_all()
+    rng = random.Random(reader_id)
+    client = Client()
+    latencies, errors = [], 0
+    while time.monotonic() < deadline:
+        if rng.random() < 0.5:
+            url, params = reverse('index'), {'after': rng.choice(cursors)}
+        else:
+            url, params = rng.choice(post_urls), {}
+        if cold:
+            cache.clear()
+        started = time.perf_counter()
+        try:
+            status = client.get(url, params).status_code
+        except OperationalError:
+            status = None
+        latencies.append(time.perf_counter() - started)
+        if status != 200:
+            errors += 1
+    connections.close_all()
+    results.put(('reader', latencies, errors))
+
+
+def writer(writer_id, user_id, comment_urls, deadline, results):
+    connections.close_all()
+    rng = random.Random(-writer_id)
+    client = Client()
+    client.force_login(User.objects.get(pk=user_id))
+    latencies, errors = [], 0
+    while time.monotonic() < deadline:
+        if rng.random() < 0.3:
+            url, data = reverse('new_post'), {'text': f'{MARK} {writer_id}'}
+        else:
+            url, data = rng.choice(comment_urls), {'text': f'{MARK} {writer_id}'}
+        started = time.perf_counter()
+        try:
+            # тестовый клиент пробрасывает исключение view: блокировка,
+            # которую не пережили повторы retry_locked
+            status = client.post(url, data).status_code
+        except OperationalError:
+            status = None
+        latencies.append(time.perf_counter() - started)
+        if status != 302:
+            errors += 1
+    connections.close_all()
+    results.put(('writer', latencies, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет пропускную способность чтения лент и постов отдельными '
+        'процессами без писателей и вместе с процессами, которые пишут '
+        'посты и комментарии через new_post и add_comment'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=10.0, help='секунд на фазу')
+        parser.add_argument('--cold', action='store_true', help='очищать кэш перед чтением')
+        parser.add_argument(
+            '--output', help='файл для результатов, по умолчанию bench_results/<время>-<коммит>-concurrency.json'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write(f'бенчмарк рассчитан на SQLite, а БД - {connection.vendor}')
+        posts = list(Post.objects.select_related('author').order_by('?')[:200])
+        writers = list(
+            User.objects.annotate(posts=Count('author_posts')).order_by('-posts')
+            .values_list('pk', flat=True)[:options['writers']]
+        )
+        if not posts or len(writers) < options['writers']:
+            raise CommandError('В базе нет данных: запустите manage.py seed_data')
+        post_urls = [reverse('post', args=[post.author.username, post.pk]) for post in posts]
+        comment_urls = [
+            reverse('add_comment', args=[post.author.username, post.pk]) for post in posts
+        ]
+        cursors = [encode_cursor(post) for post in posts]
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+
+        phases = {}
+        try:
+            for phase, writer_count in (('reads', 0), ('reads+writes', options['writers'])):
+                phases[phase] = self.run_phase(
+                    options, post_urls, comment_urls, cursors, writers[:writer_count]
+                )
+        finally:
+            deleted, _ = Post.objects.filter(text__startswith=MARK).delete()
+            Comment.objects.filter(text__startswith=MARK).delete()
+            self.stdout.write(f'удалено записей бенчмарка: {deleted}')
+
+        self.stdout.write(
+            f"{'фаза':<14}{'чтений/с':>10}{'p50':>9}{'p95':>9}"
+            f"{'записей/с':>11}{'p95':>9}{'ошибки':>8}"
+        )
+        for phase, row in phases.items():
+            self.stdout.write(
+                f"{phase:<14}{row['reads_per_s']:>10.1f}{row['read_p50_ms']:>9.2f}"
+                f"{row['read_p95_ms']:>9.2f}{row['writes_per_s']:>11.1f}"
+                f"{row['write_p95_ms']:>9.2f}{row['read_errors'] + row['write_errors']:>8}"
+            )
+        ratio = phases['reads+writes']['reads_per_s'] / max(phases['reads']['reads_per_s'], 0.001)
+        self.stdout.write(f'чтение под записью: {ratio:.0%} от чтения без записи')
+
+        commit = current_commit()
+        report = {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'database': connection.vendor,
+            'engine': settings.DATABASES['default']['ENGINE'],
+            'journal_mode': journal_mode,
+            'readers': options['readers'],
+            'writers': options['writers'],
+            'duration': options['duration'],
+            'cold_cache': options['cold'],
+            'phases': phases,
+            'read_ratio': round(ratio, 3),
+        }
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'bench_results',
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}-concurrency.json",
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as target:
+            json.dump(report, target, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'результаты: {output}'))
+
+    def run_phase(self, options, post_urls, comment_urls, cursors, writers):
+        # соединение SQLite нельзя унаследовать через fork: закрываем до запуска
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        deadline = time.monotonic() + options['duration']
+        processes = [
+            context.Process(
+                target=reader,
+                args=(number, post_urls, cursors, deadline, options['cold'], results),
+            )
+            for number in range(options['readers'])
+        ] + [
+            context.Process(
+                target=writer, args=(number, user_id, comment_urls, deadline, results)
+            )
+            for number, user_id in enumerate(writers)
+        ]
+        for process in processes:
+            process.start()
+        collected = {'reader': ([], 0), 'writer': ([], 0)}
+        for _ in processes:
+            kind, latencies, errors = results.get()
+            previous, previous_errors = collected[kind]
+            collected[kind] = (previous + latencies, previous_errors + errors)
+        for process in processes:
+            process.join()
+        reads, read_errors = collected['reader']
+        writes, write_errors = collected['writer']
+        duration = options['duration']
+        return {
+            'reads_per_s': round(len(reads) / duration, 1),
+            'read_p50_ms': round(percentile(reads, 0.50) * 1000, 3) if reads else 0,
+            'read_p95_ms': round(percentile(reads, 0.95) * 1000, 3) if reads else 0,
+            'read_errors': read_errors,
+            'writes_per_s': round(len(writes) / duration, 1),
+            'write_p95_ms': round(percentile(writes, 0.95) * 1000, 3) if writes else 0,
+            'write_errors': write_errors,
+        }
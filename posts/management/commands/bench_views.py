@@ -0,0 +1,188 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from posts import urls as post_urls
+from posts.models import Follow, Group, Post, User
+from posts.pagination import encode_cursor
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет все адреса posts/urls.py через тестовый клиент и сохраняет '
+        'p50/p95/p99 задержки, число запросов к БД и размер ответа в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='запросов на адрес')
+        parser.add_argument('--cold', action='store_true', help='очищать кэш перед запросом')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='файл для результатов, по умолчанию bench_results/<время>-<коммит>.json'
+        )
+        parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        reader = (
+            User.objects.annotate(follows=Count('follower')).order_by('-follows').first()
+        )
+        posts = list(Post.objects.select_related('author', 'group').order_by('?')[:200])
+        groups = list(Group.objects.values_list('slug', flat=True)[:50])
+        if reader is None or not posts or not groups:
+            raise CommandError('В базе нет данных: запустите manage.py seed_data')
+        authors = list({post.author.username for post in posts} - {reader.username})
+
+        client = Client()
+        client.force_login(reader)
+        own_post = Post.objects.filter(author=reader).first()
+
+        def feed_params():
+            # половина запросов - глубокие страницы с курсором
+            if rng.random() < 0.5:
+                return {'after': encode_cursor(rng.choice(posts))}
+            return {}
+
+        def followed_author():
+            # отписка от того, на кого не подписан, - 404, готовим подписку заранее
+            author = User.objects.get(username=rng.choice(authors))
+            Follow.objects.get_or_create(user=reader, author=author)
+            return author.username
+
+        def post_kwargs():
+            post = rng.choice(posts)
+            return {'username': post.author.username, 'post_id': post.pk}
+
+        requests = {
+            'index': lambda: ('get', reverse('index'), feed_params()),
+            'group_posts': lambda: (
+                'get', reverse('group_posts', args=[rng.choice(groups)]), feed_params()
+            ),
+            'new_post': lambda: ('get', reverse('new_post'), {}),
+            'follow_index': lambda: ('get', reverse('follow_index'), feed_params()),
+            'search': lambda: ('get', reverse('search'), {'q': rng.choice(posts).text.split()[0]}),
+            'profile': lambda: (
+                'get', reverse('profile', args=[rng.choice(authors)]), feed_params()
+            ),
+            'post': lambda: ('get', reverse('post', kwargs=post_kwargs()), {}),
+            'post_comments': lambda: (
+                'get', reverse('post_comments', kwargs=post_kwargs()), {'format': 'json'}
+            ),
+            'post_edit': lambda: (
+                'get',
+                reverse('post_edit', args=[reader.username, own_post.pk])
+                if own_post else reverse('post_edit', kwargs=post_kwargs()),
+                {},
+            ),
+            'add_comment': lambda: (
+                'post', reverse('add_comment', kwargs=post_kwargs()), {'text': 'бенчмарк'}
+            ),
+            'profile_follow': lambda: (
+                'get', reverse('profile_follow', args=[rng.choice(authors)]), {}
+            ),
+            'profile_unfollow': lambda: (
+                'get', reverse('profile_unfollow', args=[followed_author()]), {}
+            ),
+        }
+        names = [pattern.name for pattern in post_urls.urlpatterns]
+        missing = [name for name in names if name not in requests]
+        if missing:
+            self.stderr.write('нет сценария для: ' + ', '.join(missing))
+
+        results = {}
+        # записи (комментарии, подписки) откатываются после прогона; миниатюры
+        # делаются синхронно, иначе потоки пула пишут в БД мимо транзакции
+        with override_settings(POST_THUMBNAIL_EXECUTOR='sync'), transaction.atomic():
+            for name in names:
+                if name not in requests:
+                    continue
+                latencies, queries, sizes, statuses = [], [], [], {}
+                for _ in range(options['iterations']):
+                    method, url, params = requests[name]()
+                    if options['cold']:
+                        cache.clear()
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        response = getattr(client, method)(url, params)
+                        body = (
+                            b''.join(response.streaming_content)
+                            if response.streaming else response.content
+                        )
+                        latencies.append(time.perf_counter() - started)
+                    queries.append(len(captured))
+                    sizes.append(len(body))
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                results[name] = {
+                    'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                    'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+                    'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                    'queries': round(statistics.mean(queries), 2),
+                    'max_queries': max(queries),
+                    'bytes': round(statistics.mean(sizes)),
+                    'statuses': statuses,
+                }
+            transaction.set_rollback(True)
+
+        commit = current_commit()
+        report = {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'iterations': options['iterations'],
+            'cold_cache': options['cold'],
+            'cache_backend': settings.CACHES['default']['BACKEND'],
+            'database': connection.vendor,
+            'posts': Post.objects.count(),
+            'views': results,
+        }
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as source:
+                previous = json.load(source)['views']
+
+        self.stdout.write(
+            f"{'адрес':<18}{'p50':>9}{'p95':>9}{'p99':>9}{'запр.':>7}{'байт':>9}"
+        )
+        for name, row in results.items():
+            line = (
+                f"{name:<18}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+                f"{row['p99_ms']:>9.2f}{row['queries']:>7.1f}{row['bytes']:>9}"
+            )
+            if previous and name in previous:
+                change = row['p50_ms'] / max(previous[name]['p50_ms'], 0.001) - 1
+                line += f"  p50 {change:+.0%}, запр. {row['queries'] - previous[name]['queries']:+.1f}"
+            self.stdout.write(line)
+
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'bench_results', f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as target:
+            json.dump(report, target, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'результаты: {output}'))
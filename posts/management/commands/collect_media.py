@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts import media
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки постов, на которые не осталось ссылок, '
+        'и файлы, которых нет ни в одном посте'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='сначала пересчитать ссылки по таблице постов'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только показать, что будет удалено'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(f'файлов с постами: {media.rebuild_refs()}')
+        removed = media.sweep(dry_run=options['dry_run'])
+        for name in removed[:20]:
+            self.stdout.write(f'  {name}')
+        self.stdout.write(self.style.SUCCESS(f'удалено файлов: {len(removed)}'))
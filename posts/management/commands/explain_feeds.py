@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import query_plans
+from posts.models import Follow, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает планы и время запросов лент на текущей базе и падает, '
+        'если какой-то из них сортирует результат вместо обхода индекса'
+    )
+
+    def handle(self, *args, **options):
+        follow = Follow.objects.order_by('pk').first()
+        total = Post.objects.count()
+        # пост из середины ленты: курсор второй и дальнейших страниц
+        post = Post.objects.filter(group__isnull=False)[total // 2:].first()
+        if post is None or follow is None:
+            raise CommandError('Нужны посты в группах и хотя бы одна подписка')
+
+        sorted_feeds = []
+        queries = query_plans.feed_queries(post, follow.user)
+        for name, queryset in queries.items():
+            plan = query_plans.explain(queryset)
+            started = time.perf_counter()
+            list(queryset)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(f'== {name}: {elapsed:.2f} мс\n{plan}\n')
+            if query_plans.uses_sort(plan):
+                sorted_feeds.append(name)
+        if sorted_feeds:
+            raise CommandError('Сортировка вместо индекса: ' + ', '.join(sorted_feeds))
+        self.stdout.write(self.style.SUCCESS('Все ленты читаются по индексу'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed_cache
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша лент'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true', help='обнулить счётчики после вывода'
+        )
+
+    def handle(self, *args, **options):
+        stats = feed_cache.stats()
+        self.stdout.write(
+            'версия: {version}\nпопаданий: {hits}\nпромахов: {misses}\n'
+            'доля попаданий: {hit_rate:.1%}'.format(**stats)
+        )
+        if not stats['shared']:
+            # file, db и locmem считают в памяти процесса, а не в кэше
+            self.stdout.write(
+                'счётчики этого процесса; по воркерам - admin/stats/ и /metrics'
+            )
+        if options['reset']:
+            feed_cache.reset_stats()
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from posts import freshness, images, thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет через приём картинок посты, загруженные до него: '
+        'уменьшает, перекодирует и записывает размеры'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только показать, сколько картинок будет обработано'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image=None).filter(image_size=None)
+        self.stdout.write(f'картинок к обработке: {posts.count()}')
+        if options['dry_run']:
+            return
+        before = after = failed = 0
+        for post in posts.iterator():
+            try:
+                with post.image.open('rb') as source:
+                    size = source.size
+                    ingested = images.ingest(source)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{post.image.name}: {error}')
+                continue
+            # старый файл удалит media, когда на него не останется ссылок
+            post.image.save(ingested.file.name, ingested.file, save=False)
+            post.image_width, post.image_height = ingested.width, ingested.height
+            post.image_size = ingested.size
+            post.save(update_fields=['image', 'image_width', 'image_height', 'image_size'])
+            thumbnails.schedule(post)
+            before += size
+            after += ingested.size
+        # update_fields без даты правки: страницы с постами не должны отвечать 304
+        freshness.touch(freshness.ALL)
+        self.stdout.write(self.style.SUCCESS(
+            f'было {before / 1024 / 1024:.1f} МБ, стало {after / 1024 / 1024:.1f} МБ, '
+            f'ошибок: {failed}'
+        ))
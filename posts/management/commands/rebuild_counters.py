@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts import freshness
+from posts.models import Comment, Follow, Post, User, UserStats
+
+
+def count_by(queryset, field):
+    return dict(
+        queryset.order_by().values_list(field).annotate(count=Count('pk'))
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики подписчиков, подписок, постов и комментариев'
+
+    def handle(self, *args, **options):
+        followers = count_by(Follow.objects.all(), 'author')
+        following = count_by(Follow.objects.all(), 'user')
+        posts = count_by(Post.objects.all(), 'author')
+        comments = Comment.objects.filter(post=OuterRef('pk')).order_by()
+        with transaction.atomic():
+            UserStats.objects.all().delete()
+            UserStats.objects.bulk_create(
+                (
+                    UserStats(
+                        user_id=user_id,
+                        followers_count=followers.get(user_id, 0),
+                        following_count=following.get(user_id, 0),
+                        posts_count=posts.get(user_id, 0),
+                    )
+                    for user_id in User.objects.values_list('pk', flat=True).iterator()
+                ),
+                batch_size=500,
+            )
+            updated = Post.objects.update(comments_count=Coalesce(Subquery(
+                comments.values('post').annotate(count=Count('pk')).values('count')[:1]
+            ), 0))
+        # update() мимо сигналов: счётчики на страницах не должны отвечать 304
+        freshness.touch(freshness.ALL)
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны: пользователей {UserStats.objects.count()}, '
+            f'постов {updated}'
+        ))
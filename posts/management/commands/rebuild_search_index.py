@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс по тексту всех постов'
+
+    def handle(self, *args, **options):
+        backend = search.backend()
+        count = 0
+        with transaction.atomic():
+            backend.clear()
+            for post in Post.objects.only('pk', 'text').iterator(chunk_size=1000):
+                backend.index(post)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано постов: {count} ({backend.name})'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново раскладывает посты по лентам подписчиков, '
+        'например после изменения TIMELINE_FANOUT_LIMIT'
+    )
+
+    def handle(self, *args, **options):
+        follows = Follow.objects.values_list('user_id', 'author_id').distinct()
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            for user_id, author_id in follows.iterator():
+                timeline.backfill(user_id, author_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны: записей {TimelineEntry.objects.count()}'
+        ))
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import cards, feed_cache, freshness, thumbnails
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+
+def process_image(name):
+    return name, thumbnails.generate_in_pool(name)
+
+
+def sizes_signature():
+    sizes = json.dumps(thumbnails.sizes(), sort_keys=True)
+    return hashlib.md5(sizes.encode()).hexdigest()[:12]
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново генерирует миниатюры всех картинок из MEDIA_ROOT/posts/ '
+        'в пуле процессов. Прерванный запуск продолжается с того же места'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='только показать, сколько картинок будет обработано'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='забыть сохранённый прогресс и пройти все картинки заново'
+        )
+        parser.add_argument(
+            '--state-file',
+            help='файл с прогрессом, по умолчанию в MEDIA_ROOT'
+        )
+
+    def images(self):
+        root = os.path.join(settings.MEDIA_ROOT, 'posts')
+        for directory, _, files in os.walk(root):
+            for filename in sorted(files):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(directory, filename)
+                    yield os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+
+    def handle(self, *args, **options):
+        # прогресс хранится отдельно для каждого набора размеров миниатюр
+        state_file = options['state_file'] or os.path.join(
+            settings.MEDIA_ROOT, f'.rethumbnail-{sizes_signature()}'
+        )
+        if options['restart'] and os.path.exists(state_file):
+            os.remove(state_file)
+        done = set()
+        if os.path.exists(state_file):
+            with open(state_file) as state:
+                done = set(state.read().split('\n'))
+
+        names = [name for name in self.images() if name not in done]
+        self.stdout.write(
+            f'картинок к обработке: {len(names)}, уже готово: {len(done - {""})}'
+        )
+        if options['dry_run']:
+            for name in names[:20]:
+                self.stdout.write(f'  {name}')
+            return
+        if not names:
+            return
+
+        failed = 0
+        started = time.perf_counter()
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(options['workers']) as pool, open(state_file, 'a') as state:
+            results = pool.imap_unordered(process_image, names, chunksize=4)
+            for number, (name, ready) in enumerate(results, 1):
+                if ready:
+                    thumbnails.store_variants(name)
+                    state.write(name + '\n')
+                    state.flush()
+                else:
+                    failed += 1
+                if number % 100 == 0 or number == len(names):
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'{number}/{len(names)}  {number / elapsed:.1f} карт./с'
+                    )
+        # карточки в кэше ссылаются на старые миниатюры, а страницы
+        # с ними не должны отвечать 304
+        cards.bump_all()
+        feed_cache.bump_version()
+        freshness.touch(freshness.ALL)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'готово за {elapsed:.1f} с, {len(names) / elapsed:.1f} карт./с, '
+            f'ошибок: {failed}'
+        ))
@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import jobs
+
+
+def run_in_thread(job):
+    try:
+        return jobs.run(job)
+    finally:
+        # у каждого потока пула своё соединение с БД
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Разбирает очередь фоновых задач пулом потоков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'JOB_QUEUE_WORKERS', 4)
+        )
+        parser.add_argument(
+            '--poll', type=float, default=1.0,
+            help='пауза в секундах, когда очередь пуста'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='выполнить готовые задачи и выйти'
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='только показать сводку по задачам'
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.print_stats()
+            return
+        worker = jobs.worker_name()
+        stale_after = getattr(settings, 'JOB_QUEUE_STALE_AFTER', 10 * 60)
+        keep = getattr(settings, 'JOB_QUEUE_KEEP', 24 * 60 * 60)
+        workers = options['workers']
+        running = set()
+        done = failed = 0
+        last_cleanup = 0
+        self.stdout.write(f'воркер {worker}, потоков: {workers}')
+        with ThreadPoolExecutor(workers, thread_name_prefix='jobs') as pool:
+            try:
+                while True:
+                    if time.monotonic() - last_cleanup > stale_after:
+                        jobs.requeue_stale(stale_after)
+                        jobs.purge(keep)
+                        last_cleanup = time.monotonic()
+                    for job in jobs.claim(worker, workers - len(running)):
+                        running.add(pool.submit(run_in_thread, job))
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll'])
+                        continue
+                    finished, running = wait(
+                        running, timeout=options['poll'], return_when=FIRST_COMPLETED
+                    )
+                    for future in finished:
+                        if future.result():
+                            done += 1
+                        else:
+                            failed += 1
+            except KeyboardInterrupt:
+                self.stdout.write('останавливаемся, ждём текущие задачи')
+        self.stdout.write(self.style.SUCCESS(
+            f'выполнено задач: {done}, с ошибкой: {failed}'
+        ))
+
+    def print_stats(self):
+        self.stdout.write(
+            f'{"задача":<24}{"ждут":>7}{"идут":>7}{"готово":>8}{"ошибки":>8}'
+            f'{"повторы":>9}{"ср. мс":>9}{"макс. мс":>10}'
+        )
+        for row in jobs.stats():
+            self.stdout.write(
+                f'{row["name"]:<24}{row["queued"]:>7}{row["running"]:>7}'
+                f'{row["done"]:>8}{row["failed"]:>8}{row["retries"] or 0:>9}'
+                f'{(row["avg_duration"] or 0) * 1000:>9.1f}'
+                f'{(row["max_duration"] or 0) * 1000:>10.1f}'
+            )
@@ -0,0 +1,157 @@
+import contextlib
+import io
+import random
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from PIL import Image
+
+from posts import follow_graph, media, timeline
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    'сегодня вчера город лето зима кино книга музыка друзья работа дорога '
+    'море горы кофе утро вечер новости фото прогулка история проект идея '
+    'концерт выставка поезд самолёт дождь солнце снег парк улица дом'
+).split()
+
+
+@contextlib.contextmanager
+def manual_dates(*fields):
+    # auto_now_add перезаписал бы даты, а нам нужен разброс по времени
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу пользователями, группами, постами, картинками, '
+        'комментариями и графом подписок со степенным распределением'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--images', type=int, default=50, help='сколько разных картинок')
+        parser.add_argument('--image-share', type=float, default=0.2, help='доля постов с картинкой')
+        parser.add_argument('--follows', type=int, default=20, help='средне подписок на пользователя')
+        parser.add_argument(
+            '--alpha', type=float, default=1.2,
+            help='показатель степенного закона популярности авторов'
+        )
+        parser.add_argument('--days', type=int, default=365, help='за сколько дней посты')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        now = timezone.now()
+
+        User.objects.bulk_create(
+            [
+                User(username=f'{prefix}_user_{i}', email=f'{prefix}_{i}@example.com')
+                for i in range(options['users'])
+            ],
+            batch_size=timeline.BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        users = list(
+            User.objects.filter(username__startswith=f'{prefix}_user_')
+            .values_list('pk', flat=True)
+        )
+        Group.objects.bulk_create(
+            [
+                Group(title=f'Группа {i}', slug=f'{prefix}-group-{i}', description='Описание')
+                for i in range(options['groups'])
+            ],
+            ignore_conflicts=True,
+        )
+        groups = list(
+            Group.objects.filter(slug__startswith=f'{prefix}-group-')
+            .values_list('pk', flat=True)
+        ) + [None]
+        self.stdout.write(f'пользователей: {len(users)}, групп: {len(groups) - 1}')
+
+        # популярность авторов по степенному закону: вес 1 / rank^alpha
+        authors = users[:]
+        rng.shuffle(authors)
+        weights = [1 / (rank ** options['alpha']) for rank in range(1, len(authors) + 1)]
+
+        images = [self.make_image(rng, prefix, i) for i in range(options['images'])]
+        seconds = options['days'] * 24 * 60 * 60
+        posts = [
+            Post(
+                text=self.sentence(rng, 30),
+                author_id=rng.choices(authors, weights)[0],
+                group_id=rng.choice(groups),
+                image=rng.choice(images) if images and rng.random() < options['image_share'] else None,
+                pub_date=now - timedelta(seconds=rng.randrange(seconds)),
+            )
+            for _ in range(options['posts'])
+        ]
+        with manual_dates(Post._meta.get_field('pub_date')):
+            Post.objects.bulk_create(posts, batch_size=timeline.BATCH_SIZE)
+        post_ids = list(Post.objects.values_list('pk', 'pub_date'))
+        self.stdout.write(f'постов: {len(posts)}')
+
+        comments = []
+        for _ in range(options['comments']):
+            post_id, pub_date = rng.choice(post_ids)
+            age = max(1, int((now - pub_date).total_seconds()))
+            comments.append(Comment(
+                post_id=post_id,
+                author_id=rng.choice(users),
+                text=self.sentence(rng, 12),
+                created=pub_date + timedelta(seconds=rng.randrange(age)),
+            ))
+        with manual_dates(Comment._meta.get_field('created')):
+            Comment.objects.bulk_create(comments, batch_size=timeline.BATCH_SIZE)
+        self.stdout.write(f'комментариев: {len(comments)}')
+
+        follows = set()
+        for user_id in users:
+            count = min(len(authors) - 1, int(rng.expovariate(1 / options['follows'])))
+            for author_id in rng.choices(authors, weights, k=count):
+                if author_id != user_id:
+                    follows.add((user_id, author_id))
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id) for user_id, author_id in follows],
+            batch_size=timeline.BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        self.stdout.write(f'подписок: {len(follows)}')
+
+        # bulk_create не вызывает сигналы: пересобираем производные данные
+        for command in ('rebuild_counters', 'rebuild_timelines', 'rebuild_search_index'):
+            call_command(command, stdout=self.stdout)
+        follow_graph.reset()
+        media.rebuild_refs()
+
+    @staticmethod
+    def sentence(rng, length):
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, length))).capitalize()
+
+    @staticmethod
+    def make_image(rng, prefix, number):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        image = Image.new('RGB', (1600, 1200), color)
+        image.paste(
+            tuple(255 - channel for channel in color),
+            (rng.randrange(800), rng.randrange(600), rng.randrange(800, 1600), rng.randrange(600, 1200)),
+        )
+        content = io.BytesIO()
+        image.save(content, 'JPEG', quality=85)
+        return Post._meta.get_field('image').storage.save(
+            f'posts/{prefix}_{number}.jpg', ContentFile(content.getvalue())
+        )
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import digests
+
+
+class Command(BaseCommand):
+    help = (
+        'Рассылает подписчикам дайджесты новых постов с прошлой рассылки. '
+        'Запускается по расписанию раз в DIGEST_WINDOW'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        sent = digests.send()
+        self.stdout.write(self.style.SUCCESS(
+            f'писем: {sent}, за {time.perf_counter() - started:.1f} с'
+        ))
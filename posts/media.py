@@ -0,0 +1,95 @@
+"""Учёт ссылок на файлы картинок и сборка мусора.
+
+Картинки постов лежат в ContentAddressedStorage, и один файл может быть
+у многих постов. Сигналы постов вызывают acquire()/release() при появлении,
+смене и удалении картинки; когда ссылок не остаётся, задача очереди
+media.collect удаляет файл вместе с миниатюрами. manage.py collect_media
+подбирает то, что пропустили сигналы: пересчитывает ссылки по таблице
+постов и удаляет файлы, которых нет ни в одном посте.
+"""
+import logging
+import os
+import time
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Count
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from . import jobs
+from .models import MediaBlob, Post
+
+logger = logging.getLogger(__name__)
+
+# не трогаем свежие файлы: пост с ними может ещё сохраняться
+GRACE_SECONDS = 60 * 60
+
+
+def storage():
+    return Post._meta.get_field('image').storage
+
+
+def acquire(name):
+    if name:
+        MediaBlob.objects.acquire(name)
+
+
+def release(name):
+    if name and MediaBlob.objects.release(name):
+        jobs.enqueue('media.collect', name=name)
+
+
+def collect(name):
+    """Удаляет файл и его миниатюры, если на него так и нет ссылок."""
+    if MediaBlob.objects.filter(name=name, refs__gt=0).exists():
+        return False
+    if Post.objects.filter(image=name).exists():
+        # ссылки разошлись с таблицей постов: чинит collect_media --rebuild
+        logger.warning('На %s есть посты, но нет ссылок', name)
+        return False
+    try:
+        # ключи миниатюр sorl строит с хранилищем исходника
+        delete_thumbnails(ImageFile(name, storage()), delete_file=False)
+        storage().delete(name)
+    except SuspiciousFileOperation:
+        logger.warning('Файл %s вне MEDIA_ROOT, не удаляем', name)
+    MediaBlob.objects.filter(name=name, refs=0).delete()
+    return True
+
+
+def rebuild_refs():
+    """Пересчитывает ссылки по таблице постов."""
+    counts = dict(
+        Post.objects.exclude(image='').exclude(image=None)
+        .values_list('image').annotate(count=Count('id')).order_by()
+    )
+    MediaBlob.objects.exclude(name__in=list(counts)).update(refs=0)
+    for name, count in counts.items():
+        if not MediaBlob.objects.filter(name=name).update(refs=count):
+            MediaBlob.objects.create(name=name, refs=count)
+    return len(counts)
+
+
+def stored_files(directory='posts'):
+    root = storage().path(directory)
+    for path, _, files in os.walk(root):
+        for filename in files:
+            if not filename.startswith('.'):
+                full_path = os.path.join(path, filename)
+                yield os.path.relpath(full_path, storage().location).replace(os.sep, '/')
+
+
+def sweep(directory='posts', dry_run=False):
+    """Удаляет файлы без ссылок из directory; возвращает их имена."""
+    deadline = time.time() - GRACE_SECONDS
+    blobs = MediaBlob.objects.filter(name__startswith=directory + '/')
+    unused = set(blobs.filter(refs=0).values_list('name', flat=True))
+    known = set(blobs.values_list('name', flat=True))
+    for name in stored_files(directory):
+        if name not in known and os.path.getmtime(storage().path(name)) < deadline:
+            unused.add(name)
+    removed = []
+    for name in sorted(unused):
+        if dry_run or collect(name):
+            removed.append(name)
+    return removed
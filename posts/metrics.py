@@ -0,0 +1,288 @@
+"""Метрики запросов по именам адресов.
+
+MetricsMiddleware на каждый запрос заводит RequestMetrics: число и время
+запросов к БД считает execute_wrapper соединений, время рендеринга -
+шаблонный бэкенд DjangoTemplates из этого модуля, попадания в кэш лент и
+карточек отмечают feed_cache и cards через count_cache().
+
+Итоги складываются в гистограммы с фиксированными корзинами: накопительные
+для Prometheus (/metrics) и скользящие за последние METRICS_WINDOW секунд
+для страницы admin/stats/. Данные живут в памяти процесса: у каждого
+воркера свои.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.template.backends import django as django_backend
+from django.template.exceptions import TemplateDoesNotExist
+
+# верхние границы корзин: секунды для времени, штуки для запросов к БД
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+HISTOGRAMS = {
+    'duration': ('request_duration_seconds', TIME_BUCKETS, 'Время ответа'),
+    'queries': ('db_queries', COUNT_BUCKETS, 'Запросов к БД на ответ'),
+    'db_time': ('db_duration_seconds', TIME_BUCKETS, 'Время в БД на ответ'),
+    'template_time': ('template_duration_seconds', TIME_BUCKETS, 'Время рендеринга шаблонов'),
+}
+COUNTERS = ('cache_hits', 'cache_misses')
+SLOT_SECONDS = 10
+
+_current = threading.local()
+
+
+def enabled():
+    return getattr(settings, 'REQUEST_METRICS', True)
+
+
+def window():
+    return getattr(settings, 'METRICS_WINDOW', 5 * 60)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # последняя корзина - всё, что больше верхней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """Верхняя граница корзины, в которую попадает квантиль q."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0
+
+
+class ViewStats:
+    __slots__ = ('histograms', 'counters', 'statuses')
+
+    def __init__(self):
+        self.histograms = {
+            name: Histogram(buckets) for name, (_, buckets, _) in HISTOGRAMS.items()
+        }
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.statuses = defaultdict(int)
+
+    def observe(self, sample, status):
+        for name, histogram in self.histograms.items():
+            histogram.observe(getattr(sample, name))
+        for name in COUNTERS:
+            self.counters[name] += getattr(sample, name)
+        self.statuses[status] += 1
+
+    def merge(self, other):
+        for name, histogram in self.histograms.items():
+            histogram.merge(other.histograms[name])
+        for name in COUNTERS:
+            self.counters[name] += other.counters[name]
+        for status, count in other.statuses.items():
+            self.statuses[status] += count
+
+    @property
+    def hit_rate(self):
+        total = self.counters['cache_hits'] + self.counters['cache_misses']
+        return self.counters['cache_hits'] / total if total else None
+
+
+class Registry:
+    """Накопительные итоги и скользящее окно из слотов по SLOT_SECONDS."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.totals = defaultdict(ViewStats)
+            self.slots = deque()
+
+    def record(self, view, sample, status):
+        slot = int(time.time() // SLOT_SECONDS)
+        with self.lock:
+            self.totals[view].observe(sample, status)
+            if not self.slots or self.slots[-1][0] != slot:
+                self.slots.append((slot, defaultdict(ViewStats)))
+                self._expire(slot)
+            self.slots[-1][1][view].observe(sample, status)
+
+    def _expire(self, slot):
+        oldest = slot - window() // SLOT_SECONDS
+        while self.slots and self.slots[0][0] <= oldest:
+            self.slots.popleft()
+
+    def recent(self):
+        """Статистика по адресам за последние METRICS_WINDOW секунд."""
+        merged = defaultdict(ViewStats)
+        with self.lock:
+            self._expire(int(time.time() // SLOT_SECONDS))
+            for _, views in self.slots:
+                for view, stats in views.items():
+                    merged[view].merge(stats)
+        return dict(merged)
+
+    def cumulative(self):
+        merged = defaultdict(ViewStats)
+        with self.lock:
+            for view, stats in self.totals.items():
+                merged[view].merge(stats)
+        return dict(merged)
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    """Замеры одного запроса; заодно execute_wrapper для соединений БД."""
+
+    __slots__ = (
+        'duration', 'queries', 'db_time', 'template_time',
+        'cache_hits', 'cache_misses', 'rendering',
+    )
+
+    def __init__(self):
+        self.duration = self.db_time = self.template_time = 0
+        self.queries = self.cache_hits = self.cache_misses = 0
+        self.rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def start():
+    _current.metrics = RequestMetrics()
+    return _current.metrics
+
+
+def stop():
+    _current.metrics = None
+
+
+def current():
+    return getattr(_current, 'metrics', None)
+
+
+def count_cache(hits=0, misses=0):
+    metrics = current()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        metrics = current()
+        # вложенные render_to_string (карточки постов) уже внутри замера
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+        metrics.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+            metrics.rendering = False
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Стандартный бэкенд шаблонов, который замеряет время рендеринга."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+def summary():
+    """Строки для страницы статистики: самые затратные адреса сверху."""
+    rows = []
+    for view, stats in registry.recent().items():
+        duration = stats.histograms['duration']
+        queries = stats.histograms['queries']
+        rows.append({
+            'view': view,
+            'requests': duration.count,
+            'errors': sum(n for status, n in stats.statuses.items() if status >= 500),
+            'total_s': duration.sum,
+            'p50_ms': duration.quantile(0.5) * 1000,
+            'p95_ms': duration.quantile(0.95) * 1000,
+            'p99_ms': duration.quantile(0.99) * 1000,
+            'queries': queries.mean,
+            'queries_p95': queries.quantile(0.95),
+            'db_ms': stats.histograms['db_time'].mean * 1000,
+            'template_ms': stats.histograms['template_time'].mean * 1000,
+            'hit_rate': stats.hit_rate,
+        })
+    return sorted(rows, key=lambda row: row['total_s'], reverse=True)
+
+
+def _labels(**labels):
+    return ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+
+
+def prometheus(prefix='yatube'):
+    """Накопительные метрики в текстовом формате Prometheus."""
+    views = sorted(registry.cumulative().items())
+    lines = []
+    for name, (metric, buckets, description) in HISTOGRAMS.items():
+        metric = f'{prefix}_{metric}'
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} histogram']
+        for view, stats in views:
+            histogram = stats.histograms[name]
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append('{}_bucket{{{}}} {}'.format(
+                    metric, _labels(view=view, le=bound), cumulative
+                ))
+            lines.append(f'{metric}_sum{{{_labels(view=view)}}} {histogram.sum:.6f}')
+            lines.append(f'{metric}_count{{{_labels(view=view)}}} {histogram.count}')
+    for name in COUNTERS:
+        metric = f'{prefix}_{name}_total'
+        lines += [f'# HELP {metric} Обращения к кэшу лент и карточек', f'# TYPE {metric} counter']
+        for view, stats in views:
+            lines.append(f'{metric}{{{_labels(view=view)}}} {stats.counters[name]}')
+    metric = f'{prefix}_responses_total'
+    lines += [f'# HELP {metric} Ответы по кодам статуса', f'# TYPE {metric} counter']
+    for view, stats in views:
+        for status, count in sorted(stats.statuses.items()):
+            lines.append(f'{metric}{{{_labels(view=view, status=status)}}} {count}')
+    return '\n'.join(lines) + '\n'
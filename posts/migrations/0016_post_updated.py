@@ -0,0 +1,44 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:50
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Greatest
+
+
+def fill_updated(apps, schema_editor):
+    # AddField проставил всем текущее время; берём публикацию или
+    # последний комментарий, если он позже
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    comments = Comment.objects.filter(post=models.OuterRef('pk')).order_by()
+    last_comment = comments.values('post').annotate(last=models.Max('created')).values('last')[:1]
+    Post.objects.update(updated=Greatest(
+        'pub_date', Coalesce(models.Subquery(last_comment), 'pub_date')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.RunPython(fill_updated, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['updated'], name='post_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', 'updated'], name='post_group_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'updated'], name='post_author_updated'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.6 on 2026-10-18 20:30
+
+from django.db import migrations, models
+import posts.storage
+
+
+def count_refs(apps, schema_editor):
+    # уже загруженные картинки сохраняют свои имена, считаем ссылки на них
+    Post = apps.get_model('posts', 'Post')
+    MediaBlob = apps.get_model('posts', 'MediaBlob')
+    counts = (
+        Post.objects.exclude(image='').exclude(image=None)
+        .values_list('image').annotate(count=models.Count('id')).order_by()
+    )
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name, refs=count) for name, count in counts], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_post_image_meta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('refs', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/'),
+        ),
+        migrations.RunPython(count_refs, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,12 @@
-from django.db import models 
+import json
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth import get_user_model 
 from django import forms
 
+from .storage import ContentAddressedStorage
+
   
 User = get_user_model() 
   
@@ -13,21 +18,71 @@ class Group(models.Model):
     def __str__(self): 
         return self.title 
 
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        # автор и группа одним JOIN, число комментариев хранится в самом посте,
+        # поэтому карточка поста не делает отдельных запросов
+        return self.select_related('author', 'group')
+
   
 class Post(models.Model): 
     text = models.TextField("Текс поста")
     pub_date = models.DateTimeField("Дата публикации", auto_now_add=True, db_index=True)
+    # правка поста или изменение его комментариев: по нему считается Last-Modified
+    updated = models.DateTimeField("Дата изменения", auto_now=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="author_posts") 
     group = models.ForeignKey(Group, on_delete=models.SET_NULL, blank=True, null=True, 
             related_name="group_posts") 
-    image = models.ImageField(upload_to='posts/', blank=True, null=True) 
+    image = models.ImageField(
+        upload_to='posts/', blank=True, null=True, storage=ContentAddressedStorage()
+    )
+    # заполняются при приёме картинки (posts.images), без чтения файла
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_size = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # JSON со списком готовых вариантов картинки разной ширины для srcset,
+    # его пишет очередь миниатюр (posts.thumbnails)
+    image_variants = models.TextField(blank=True, default='', editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    # счётчики меняются только через UPDATE ... SET x = x + 1,
+    # обычный save() не должен перетирать их устаревшим значением
+    counter_fields = ('comments_count',)
+    # варианты картинки пишет фоновая задача, правка поста их не перетирает
+    derived_fields = ('image_variants',)
                                                                                             
     class Meta: 
         ordering = ["-pub_date"]
+        # индексы повторяют ORDER BY лент (pub_date, id) с keyset-курсором,
+        # чтобы страница читалась диапазоном по индексу без сортировки
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_feed'),
+            models.Index(fields=['group', '-pub_date', '-id'], name='post_group_feed'),
+            models.Index(fields=['author', '-pub_date', '-id'], name='post_author_feed'),
+            # MAX(updated) для условных GET читается из индекса
+            models.Index(fields=['updated'], name='post_updated'),
+            models.Index(fields=['group', 'updated'], name='post_group_updated'),
+            models.Index(fields=['author', 'updated'], name='post_author_updated'),
+        ]
  
     def __str__(self):
        return self.text
 
+    def variants(self):
+        return json.loads(self.image_variants) if self.image_variants else []
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields + self.derived_fields
+            ]
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
@@ -35,6 +90,11 @@ class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField("Дата публикации", auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'], name='comment_post_created'),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -42,3 +102,188 @@ class Comment(models.Model):
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follower')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'], name='unique_follow'),
+        ]
+        indexes = [
+            models.Index(fields=['author', 'user'], name='follow_author_user'),
+        ]
+
+
+class UserStatsManager(models.Manager):
+    def count_for(self, user_id):
+        return {
+            'followers_count': Follow.objects.filter(author_id=user_id).count(),
+            'following_count': Follow.objects.filter(user_id=user_id).count(),
+            'posts_count': Post.objects.filter(author_id=user_id).count(),
+        }
+
+    def for_user(self, user):
+        try:
+            return self.get(user=user)
+        except self.model.DoesNotExist:
+            return self.rebuild(user.pk)
+
+    def rebuild(self, user_id):
+        counts = self.count_for(user_id)
+        try:
+            stats, _ = self.update_or_create(user_id=user_id, defaults=counts)
+        except IntegrityError:
+            # строку успел создать параллельный запрос
+            stats = self.get(user_id=user_id)
+        return stats
+
+    def bump(self, user_id, **deltas):
+        rows = self.filter(user_id=user_id)
+        for field, delta in deltas.items():
+            if delta < 0:
+                rows = rows.filter(**{f'{field}__gte': -delta})
+        updated = rows.update(
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+        # нет строки - пересчитываем с нуля, но не при удалении:
+        # так пользователь, которого сейчас удаляют, не получит новую строку
+        if not updated and any(delta > 0 for delta in deltas.values()):
+            self.rebuild(user_id)
+
+    def bump_many(self, user_ids, **deltas):
+        """bump() для многих пользователей одним UPDATE."""
+        rows = self.filter(user_id__in=user_ids)
+        for field, delta in deltas.items():
+            if delta < 0:
+                rows = rows.filter(**{f'{field}__gte': -delta})
+        rows.update(**{field: F(field) + delta for field, delta in deltas.items()})
+        if any(delta > 0 for delta in deltas.values()):
+            existing = self.filter(user_id__in=user_ids).values_list('user_id', flat=True)
+            for user_id in set(user_ids) - set(existing):
+                self.rebuild(user_id)
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='stats'
+    )
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
+
+    objects = UserStatsManager()
+
+    def __str__(self):
+        return f'{self.user}: {self.followers_count}/{self.following_count}/{self.posts_count}'
+
+
+class TimelineEntry(models.Model):
+    # материализованная лента подписок: строка на каждый пост
+    # автора, на которого подписан user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_timeline_post'),
+        ]
+        indexes = [
+            # покрывающий индекс для чтения ленты диапазоном
+            models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_date'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class SearchTerm(models.Model):
+    # обратный индекс для поиска, когда SQLite FTS5 недоступен
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_terms')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'post'], name='search_term_post'),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+class Job(models.Model):
+    # очередь фоновых задач в БД, её разбирает manage.py run_jobs
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'в очереди'),
+        (RUNNING, 'выполняется'),
+        (DONE, 'выполнена'),
+        (FAILED, 'не удалась'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.TextField(default='{}')
+    # одинаковые задачи в очереди не дублируются
+    key = models.CharField(max_length=32)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at', 'id'], name='job_queue'),
+            models.Index(fields=['key', 'status'], name='job_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}: {self.status}'
+
+
+class DigestRun(models.Model):
+    # рассылка дайджестов за окно (since, until]; по last_user
+    # прерванная рассылка продолжается с того же подписчика
+    since = models.DateTimeField()
+    until = models.DateTimeField()
+    last_user = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.since:%Y-%m-%d %H:%M} - {self.until:%Y-%m-%d %H:%M}: {self.sent}'
+
+
+class MediaBlobManager(models.Manager):
+    def acquire(self, name):
+        if not self.filter(name=name).update(refs=F('refs') + 1):
+            try:
+                with transaction.atomic():
+                    self.create(name=name, refs=1)
+            except IntegrityError:
+                # строку успел создать параллельный запрос
+                self.filter(name=name).update(refs=F('refs') + 1)
+
+    def release(self, name):
+        """Снимает ссылку; True, если ссылок на файл больше нет."""
+        self.filter(name=name, refs__gt=0).update(refs=F('refs') - 1)
+        return not self.filter(name=name, refs__gt=0).exists()
+
+
+class MediaBlob(models.Model):
+    # файл хранилища картинок и число постов, которые на него ссылаются
+    name = models.CharField(max_length=100, unique=True)
+    refs = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = MediaBlobManager()
+
+    def __str__(self):
+        return f'{self.name}: {self.refs}'
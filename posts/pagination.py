@@ -0,0 +1,108 @@
+from functools import partial
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+def encode_cursor(post, key='pub_date'):
+    return make_cursor(getattr(post, key), post.pk)
+
+
+def make_cursor(moment, pk):
+    return urlsafe_base64_encode(force_bytes(f'{moment.isoformat()}|{pk}'))
+
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        moment, pk = urlsafe_base64_decode(value).decode().split('|')
+        moment, pk = parse_datetime(moment), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if moment is None:
+        return None
+    return moment, pk
+
+
+def keyset_window(queryset, cursor, limit, newer=False, key='pub_date', tiebreak='pk'):
+    """Окно выборки после курсора: старее (по умолчанию) или новее его."""
+    return list(keyset_queryset(queryset, cursor, newer, key, tiebreak)[:limit])
+
+
+def keyset_queryset(queryset, cursor, newer=False, key='pub_date', tiebreak='pk'):
+    if newer:
+        order, lookup = (key, tiebreak), 'gt'
+    else:
+        order, lookup = (f'-{key}', f'-{tiebreak}'), 'lt'
+    if cursor is not None:
+        moment, pk = cursor
+        # (key, tiebreak) < (moment, pk), записанное так, чтобы у планировщика
+        # был диапазон по key: тогда страница читается по индексу без сортировки
+        queryset = queryset.filter(
+            Q(**{f'{key}__{lookup}e': moment}),
+            Q(**{f'{key}__{lookup}': moment}) | Q(**{f'{tiebreak}__{lookup}': pk}),
+        )
+    return queryset.order_by(*order)
+
+
+def paginate_feed(request, feed, per_page, key='pub_date'):
+    """Keyset-пагинация ленты по (pub_date, id) без COUNT(*) и OFFSET.
+
+    Страница задаётся курсором ?after=... (следующая) или ?before=...
+    (предыдущая), поэтому глубокие страницы стоят столько же, сколько первая.
+    feed - QuerySet или функция window(cursor, limit, newer) со списком постов.
+    Возвращает обычные Paginator и Page, чтобы шаблоны и контекст не менялись;
+    ссылки на соседние страницы лежат в page.next_cursor и page.previous_cursor.
+    """
+    window = feed if callable(feed) else partial(keyset_window, feed, key=key)
+    after = decode_cursor(request.GET.get('after'))
+    before = None if after else decode_cursor(request.GET.get('before'))
+    posts, has_next, has_previous = None, False, False
+    if before is not None:
+        rows = window(before, per_page + 1, newer=True)
+        has_previous = len(rows) > per_page
+        if has_previous or len(rows) == per_page:
+            posts, has_next = rows[:per_page][::-1], True
+    if posts is None:
+        # первая страница, следующая страница или короткий «хвост» сверху
+        rows = window(after, per_page + 1)
+        posts = rows[:per_page]
+        has_next = len(rows) > per_page
+        has_previous = after is not None
+
+    return build_page(
+        posts, per_page,
+        encode_cursor(posts[-1], key) if has_next and posts else None,
+        encode_cursor(posts[0], key) if has_previous and posts else None,
+    )
+
+
+def paginate_comments(request, comments, per_page):
+    """Комментарии по порядку created, страница после курсора ?after=...
+
+    Возвращает QuerySet комментариев страницы и курсор следующей (None, если
+    её нет). Окно выбирается по индексу одними ключами (created, id), сами
+    комментарии - вторым запросом по id, когда шаблон их прочитает.
+    """
+    after = decode_cursor(request.GET.get('after'))
+    keys = keyset_window(
+        comments.values_list('created', 'pk'), after, per_page + 1, newer=True, key='created'
+    )
+    next_cursor = None
+    if len(keys) > per_page:
+        next_cursor = make_cursor(*keys[per_page - 1])
+    page = comments.filter(pk__in=[pk for _, pk in keys[:per_page]]).order_by('created', 'pk')
+    return page, next_cursor
+
+
+def build_page(posts, per_page, next_cursor=None, previous_cursor=None):
+    # Paginator над уже выбранным окном: count() берётся из len() без запроса
+    paginator = Paginator(posts, per_page)
+    page = paginator.page(1)
+    page.next_cursor = next_cursor
+    page.previous_cursor = previous_cursor
+    return paginator, page
@@ -0,0 +1,93 @@
+"""Бюджеты запросов к БД для тестов.
+
+BUDGETS задаёт для каждой страницы предел запросов: постоянную часть и
+надбавку на элемент страницы (для лент она нулевая - число запросов не
+должно зависеть от числа постов). assert_max_queries() падает со списком
+выполненного SQL, assert_constant_queries() проверяет, что число запросов
+не растёт вместе с содержимым страницы. Замеры идут с пустым кэшем, иначе
+кэш лент и карточек прячет N+1.
+"""
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+
+class Budget(namedtuple('Budget', 'base per_item')):
+    __slots__ = ()
+
+    def limit(self, page_size=0):
+        return self.base + self.per_item * page_size
+
+
+# пользователь авторизован, кэш пуст, у постов есть картинки;
+# в base входят сессия, пользователь и поиск миниатюр в thumbnail_kvstore,
+# у страниц с условным GET ещё MAX(updated) для ETag и Last-Modified,
+# у поста - ключи окна комментариев и сами комментарии по id
+BUDGETS = {
+    'index': Budget(5, 0),
+    'group_posts': Budget(6, 0),
+    'profile': Budget(8, 0),
+    'follow_index': Budget(6, 0),
+    'post': Budget(9, 0),
+}
+
+
+def _report(message, queries):
+    lines = [message]
+    for number, query in enumerate(queries, 1):
+        lines.append(f'{number}. {query["sql"]}')
+    repeated = [
+        (sql, count) for sql, count in
+        Counter(query['sql'] for query in queries).most_common() if count > 1
+    ]
+    if repeated:
+        lines.append('Повторяются:')
+        lines += [f'{count} x {sql}' for sql, count in repeated]
+    return '\n'.join(lines)
+
+
+@contextmanager
+def assert_max_queries(limit, label='', using=DEFAULT_DB_ALIAS):
+    """Как assertNumQueries, но проверяет верхнюю границу."""
+    with CaptureQueriesContext(connections[using]) as captured:
+        yield captured
+    if len(captured) > limit:
+        raise AssertionError(_report(
+            f'{label or "Блок"}: {len(captured)} запросов при бюджете {limit}',
+            captured.captured_queries,
+        ))
+
+
+def capture(client, url, data=None, using=DEFAULT_DB_ALIAS):
+    """Запросы к БД одного GET с пустым кэшем."""
+    cache.clear()
+    with CaptureQueriesContext(connections[using]) as captured:
+        response = client.get(url, data)
+    assert response.status_code == 200, f'{url}: ответ {response.status_code}'
+    return captured.captured_queries
+
+
+def assert_view_budget(client, name, kwargs=None, data=None, page_size=0):
+    """Проверяет страницу name по её бюджету из BUDGETS."""
+    limit = BUDGETS[name].limit(page_size)
+    url = reverse(name, kwargs=kwargs)
+    with assert_max_queries(limit, label=url):
+        capture(client, url, data)
+
+
+def assert_constant_queries(client, url, grow, steps=2, data=None):
+    """Число запросов к url не меняется после каждого вызова grow()."""
+    expected = capture(client, url, data)
+    for step in range(steps):
+        grow()
+        queries = capture(client, url, data)
+        if len(queries) != len(expected):
+            raise AssertionError(_report(
+                f'{url}: {len(expected)} -> {len(queries)} запросов '
+                f'после шага {step + 1} роста страницы',
+                queries,
+            ))
@@ -0,0 +1,46 @@
+"""Планы запросов лент: проверка, что страницы читаются по индексу.
+
+feed_queries() собирает те же запросы, что выполняют представления
+(с keyset-курсором второй страницы), а uses_sort() ищет в плане сортировку
+результата вместо обхода индекса.
+"""
+from .models import Comment, Follow, Post, TimelineEntry
+from .pagination import keyset_queryset
+
+# признаки сортировки в плане: SQLite и PostgreSQL
+SORT_MARKERS = ('USE TEMP B-TREE FOR', 'Sort Key', 'Sort  (')
+
+
+def window_queryset(queryset, cursor, limit, **kwargs):
+    return keyset_queryset(queryset, cursor, **kwargs)[:limit]
+
+
+def feed_queries(post, user, per_page=10):
+    """Запросы лент вокруг поста post для пользователя user."""
+    cursor = (post.pub_date, post.pk)
+    return {
+        'index': window_queryset(Post.objects.for_feed(), cursor, per_page + 1),
+        'group_posts': window_queryset(
+            Post.objects.for_feed().filter(group_id=post.group_id), cursor, per_page + 1
+        ),
+        'profile': window_queryset(
+            Post.objects.for_feed().filter(author_id=post.author_id), cursor, per_page + 1
+        ),
+        'follow_index': window_queryset(
+            TimelineEntry.objects.filter(user=user).values_list('pub_date', 'post_id'),
+            cursor, per_page + 1, tiebreak='post_id',
+        ),
+        'comments': window_queryset(
+            Comment.objects.filter(post=post).values_list('created', 'pk'),
+            cursor, per_page + 1, newer=True, key='created',
+        ),
+        'following': Follow.objects.filter(author_id=post.author_id, user=user),
+    }
+
+
+def uses_sort(plan):
+    return any(marker in plan for marker in SORT_MARKERS)
+
+
+def explain(queryset):
+    return queryset.explain()
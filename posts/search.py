@@ -0,0 +1,152 @@
+"""Полнотекстовый поиск по тексту постов.
+
+Текст разбивается на слова, приводится к нижнему регистру (ё -> е),
+очищается от стоп-слов и грубо стеммится по окончаниям русских слов.
+Полученные термы хранятся в обратном индексе: в таблице SQLite FTS5
+posts_search, если она доступна, иначе в обычной таблице SearchTerm.
+Индекс обновляется при сохранении и удалении поста.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post, SearchTerm
+
+FTS_TABLE = 'posts_search'
+WORD_RE = re.compile(r'\w+')
+MIN_STEM = 3
+STOP_WORDS = frozenset(
+    'а без бы был была были было в вам вас весь во вот все всё вы да для до '
+    'его ее её если есть еще ещё же за и из или им их к как ко когда кто ли '
+    'мне мы на над не нет ни но ну о об он она они оно от по под при про с '
+    'со так также такой там те то тоже только тут ты у уже что чтобы эта эти '
+    'это я the and or of to in on is are a an'.split()
+)
+# окончания от длинных к коротким: отрезается первое подходящее
+ENDINGS = sorted(
+    (
+        'ившись ывшись ивши ывши ающий ающая ающее ующий ующая ующее '
+        'ейшего ейшему ейшими ейший ейшая ейшее ость ости остью остей '
+        'ами ями ого его ому ему ыми ими ией иям иях ать ять ить ыть ешь '
+        'ете ишь ите ают яют ует уют ила ило или ыла ыло ыли ала ало али '
+        'ой ей ий ый ая яя ое ее ые ие ом ем ам ям ах ях ов ев ую юю '
+        'ию ия ть ла ло ли ет ит ут ют ат ят '
+        'а я о е и ы у ю ь'
+    ).split(),
+    key=len, reverse=True,
+)
+
+
+def stem(word):
+    if not word.isalpha() or not re.search('[а-я]', word):
+        return word
+    # возвратные глаголы: вернулись, вернулась -> вернули, вернула
+    if word.endswith(('ся', 'сь')) and len(word) - 2 >= MIN_STEM:
+        word = word[:-2]
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    """Термы текста: слова в нижнем регистре без стоп-слов, со стеммингом."""
+    words = WORD_RE.findall(text.lower().replace('ё', 'е'))
+    return [stem(word) for word in words if len(word) > 1 and word not in STOP_WORDS]
+
+
+class TableBackend:
+    """Обратный индекс в обычной таблице: работает на любой БД."""
+
+    name = 'table'
+
+    def index(self, post):
+        terms = set(tokenize(post.text))
+        SearchTerm.objects.filter(post_id=post.pk).delete()
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(term=term[:64], post_id=post.pk) for term in terms],
+            batch_size=500,
+        )
+
+    def remove(self, post_id):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+    def clear(self):
+        SearchTerm.objects.all().delete()
+
+    def filter(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(
+                pk__in=SearchTerm.objects.filter(term=term[:64]).values('post_id')
+            )
+        return queryset
+
+
+class FTS5Backend:
+    """Индекс в виртуальной таблице SQLite FTS5, rowid = id поста."""
+
+    name = 'fts5'
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, terms) VALUES (%s, %s)',
+                [post.pk, ' '.join(tokenize(post.text))],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def filter(self, queryset, terms):
+        match = ' '.join('"{}"'.format(term.replace('"', '')) for term in terms)
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]
+        ))
+
+
+_fts5_available = None
+
+
+def fts5_available():
+    # таблицу создаёт миграция, проверяем её наличие один раз на процесс
+    global _fts5_available
+    if _fts5_available is None:
+        if connection.vendor != 'sqlite':
+            _fts5_available = False
+        else:
+            with connection.cursor() as cursor:
+                tables = connection.introspection.table_names(cursor)
+            _fts5_available = FTS_TABLE in tables
+    return _fts5_available
+
+
+def backend():
+    choice = getattr(settings, 'POST_SEARCH_BACKEND', 'auto')
+    if choice == 'fts5' or (choice == 'auto' and fts5_available()):
+        return FTS5Backend()
+    return TableBackend()
+
+
+def index_post(post):
+    backend().index(post)
+
+
+def remove_post(post_id):
+    backend().remove(post_id)
+
+
+def search(query, queryset=None):
+    """Посты, в тексте которых есть все слова запроса."""
+    queryset = Post.objects.all() if queryset is None else queryset
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return queryset.none()
+    return backend().filter(queryset, terms)
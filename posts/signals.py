@@ -0,0 +1,138 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cards, feed_cache, follow_graph, freshness, jobs, media, search
+from .models import Comment, Follow, Group, Post, UserStats
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.bump(instance.author_id, posts_count=1)
+        jobs.enqueue('timeline.push_post', post_id=instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    UserStats.objects.bump(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1, updated=timezone.now()
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id, comments_count__gt=0).update(
+        comments_count=F('comments_count') - 1, updated=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        follow_graph.followed(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follow_graph.unfollowed(instance.user_id, [instance.author_id])
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def feed_changed(sender, **kwargs):
+    feed_cache.bump_version()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_card_changed(sender, instance, **kwargs):
+    cards.bump(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_card_changed(sender, instance, **kwargs):
+    cards.bump(instance.post_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_cards_changed(sender, **kwargs):
+    cards.bump_all()
+
+
+@receiver(post_save, sender=Post)
+def post_freshness(sender, instance, created, **kwargs):
+    if created:
+        # счётчик постов автора виден и на страницах его постов
+        freshness.touch(f'profile:{instance.author.username}')
+    else:
+        freshness.touch(freshness.GROUPS)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted_freshness(sender, instance, **kwargs):
+    scopes = ['index', f'profile:{instance.author.username}']
+    if instance.group_id:
+        scopes.append(f'group:{instance.group.slug}')
+    freshness.touch(*scopes)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_freshness(sender, **kwargs):
+    freshness.touch(freshness.ALL)
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'text' in update_fields:
+        jobs.enqueue('search.index_post', post_id=instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_unindexed(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(pre_save, sender=Post)
+def post_image_before(sender, instance, update_fields=None, **kwargs):
+    # прежняя картинка нужна, чтобы снять с неё ссылку после сохранения
+    instance._old_image = None
+    if instance._state.adding or (update_fields is not None and 'image' not in update_fields):
+        return
+    instance._old_image = Post.objects.filter(pk=instance.pk).values_list(
+        'image', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=Post)
+def post_image_refs(sender, instance, created, update_fields=None, **kwargs):
+    # без картинки в update_fields прежнюю не читали: ссылки не меняются
+    if not created and update_fields is not None and 'image' not in update_fields:
+        return
+    new, old = instance.image.name or None, getattr(instance, '_old_image', None) or None
+    if created or new != old:
+        media.acquire(new)
+        media.release(old)
+    if not created and new != old and instance.image_variants:
+        # варианты прежней картинки; новые запишет очередь миниатюр
+        Post.objects.filter(pk=instance.pk).update(image_variants='')
+        instance.image_variants = ''
+
+
+@receiver(post_delete, sender=Post)
+def post_image_released(sender, instance, **kwargs):
+    media.release(instance.image.name)
@@ -0,0 +1,61 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Имя файла - SHA-256 его содержимого: posts/ab/ab12....webp. Одинаковые
+картинки, сколько бы раз их ни загрузили, лежат на диске одним файлом, а
+миниатюры sorl, ключ которых строится из имени исходника, делаются для
+них тоже один раз. Сколько постов ссылается на файл, считает MediaBlob
+(posts.media): удаляется только файл, на который ссылок не осталось.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        value = digest.hexdigest()
+        return os.path.join(directory, value[:2], value + extension).replace(os.sep, '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return self._save(self.hashed_name(name, content), content)
+
+    def _save(self, name, content):
+        # такой файл уже есть: содержимое то же самое по построению имени
+        if self.exists(name):
+            return name
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # пишем во временный файл и переименовываем: параллельная загрузка
+        # той же картинки не увидит недописанный файл
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                for chunk in content.chunks():
+                    output.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
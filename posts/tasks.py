@@ -0,0 +1,37 @@
+"""Задачи очереди jobs: побочные действия записи постов."""
+from . import jobs, media, search, thumbnails, timeline
+from .models import Post
+
+
+@jobs.task('timeline.push_post')
+def push_post(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    # пост успели удалить, пока задача ждала в очереди
+    if post is not None:
+        timeline.push_post(post)
+
+
+@jobs.task('timeline.restore_fanout')
+def restore_fanout(author_id):
+    timeline.restore_fanout(author_id)
+
+
+@jobs.task('search.index_post')
+def index_post(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        search.index_post(post)
+
+
+@jobs.task('thumbnails.generate')
+def generate_thumbnails(name, post_id):
+    ready = thumbnails.generate(name)
+    thumbnails.finish(name, post_id, ready)
+    if not ready:
+        # исключение отправит задачу на повтор
+        raise RuntimeError(f'Миниатюры для {name} не готовы')
+
+
+@jobs.task('media.collect')
+def collect_media(name):
+    media.collect(name)
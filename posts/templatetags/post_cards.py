@@ -0,0 +1,29 @@
+from django import template
+
+from posts import thumbnails
+from posts.cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    return render_cards([post], context.get('user'))[0]
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    # карточки всей страницы разом: одно чтение версий и одно чтение HTML
+    return render_cards(posts, context.get('user'))
+
+
+@register.simple_tag
+def card_thumbnail(post, alias='card'):
+    # готовая миниатюра или заглушка: картинка не декодируется в запросе
+    return thumbnails.card_thumbnail(post, alias)
+
+
+@register.simple_tag
+def card_image(post):
+    # src, srcset и размеры из сохранённых вариантов картинки
+    return thumbnails.card_image(post)
@@ -1,11 +1,22 @@
-from .models import Post, Group, Comment, Follow
+import json
+import tempfile
+
+from . import digests, feed_cache, follow_graph, jobs, media, metrics, query_budget, query_plans, search, thumbnails, writes
+from .models import Post, Group, Comment, Follow, Job, MediaBlob, TimelineEntry, UserStats
 from django.contrib.auth import get_user_model 
+from django.core import mail
 from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
 from django.core.files.base import File
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, Client
+from django.db import OperationalError, connection
+from django.db.models import Count
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from io import BytesIO
+from io import BytesIO, StringIO
+from unittest import mock
 from PIL import Image, ImageDraw
 
 
@@ -103,6 +114,7 @@ class TestStringMethods(TestCase):
         response = self.client.get('/auth/test404')
         self.assertEqual(response.status_code, 404)
 
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
     def test_with_picture(self):
         small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
@@ -155,9 +167,71 @@ class TestStringMethods(TestCase):
             ),
         )
 
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_image_ingestion(self):
+        file_obj = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90°
+        exif[0x010f] = 'PhoneMaker'
+        Image.new("RGB", size=(3000, 1500), color=(0, 128, 255)).save(
+            file_obj, 'jpeg', exif=exif.tobytes(), quality=100
+        )
+        upload = SimpleUploadedFile('photo.jpeg', file_obj.getvalue(), 'image/jpeg')
+        self.client.post(reverse('new_post'), {'text': 'photo', 'image': upload})
+        post = Post.objects.get(text='photo')
+        self.assertEqual((post.image_width, post.image_height), (960, 1920))
+        self.assertEqual(post.image_size, post.image.size)
+        self.assertLess(post.image_size, len(file_obj.getvalue()))
+        with Image.open(post.image) as stored:
+            self.assertEqual(stored.size, (960, 1920))
+            self.assertIn(stored.format, ('WEBP', 'JPEG'))
+            self.assertFalse(stored.info.get('exif'))
+        post.image.delete()
+
+        with override_settings(POST_IMAGE_MAX_PIXELS=100):
+            upload = SimpleUploadedFile('big.jpeg', file_obj.getvalue(), 'image/jpeg')
+            response = self.client.post(reverse('new_post'), {'text': 'big', 'image': upload})
+        self.assertTrue(response.context['form'].errors['image'])
+        self.assertFalse(Post.objects.filter(text='big').exists())
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_deduplicated_media(self):
+        file_obj = BytesIO()
+        Image.new("RGB", size=(40, 40), color=(10, 200, 30)).save(file_obj, 'png')
+        posts = []
+        for name in ('meme.png', 'copy.png'):
+            upload = SimpleUploadedFile(name, file_obj.getvalue(), 'image/png')
+            self.client.post(reverse('new_post'), {'text': name, 'image': upload})
+            posts.append(Post.objects.get(text=name))
+        name = posts[0].image.name
+        self.assertEqual(posts[1].image.name, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 2)
+        # сохранение без картинки в update_fields не трогает ссылки
+        posts[0].text = 'meme edited'
+        posts[0].save(update_fields=['text'])
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 2)
+        storage = media.storage()
+
+        posts[0].delete()
+        self.assertTrue(storage.exists(name))
+        posts[1].delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+        orphan = storage.save('posts/sweep-test/orphan.png', BytesIO(b'orphan'))
+        with mock.patch.object(media, 'GRACE_SECONDS', -1):
+            self.assertEqual(media.sweep('posts/sweep-test'), [orphan])
+        self.assertFalse(storage.exists(orphan))
+
     def test_cache(self):
         self.assertEqual(Post.objects.count(),0)
+        feed_cache.reset_stats()
         response = self.client.get(reverse('index'))
+        response_cached = self.client.get(reverse('index'))
+        self.assertEqual(response.content, response_cached.content)
+        self.assertEqual(
+            (feed_cache.stats()['hits'], feed_cache.stats()['misses']), (1, 1)
+        )
         self.post = Post.objects.create(
             text="Its driving me crazy!", 
             author=self.user,
@@ -165,7 +239,21 @@ class TestStringMethods(TestCase):
             )
         self.assertEqual(Post.objects.count(),1)
         response_new = self.client.get(reverse('index'))
-        self.assertEqual(response.content, response_new.content)
+        self.assertContains(response_new, self.post.text)
+        self.assertEqual(feed_cache.stats()['misses'], 2)
+
+    def test_cache_keyed_by_cursor(self):
+        for i in range(12):
+            Post.objects.create(text=f"post {i}", author=self.user)
+        first = self.client.get(reverse('index'))
+        second = self.client.get(
+            reverse('index'), {'after': first.context['page'].next_cursor}
+        )
+        self.assertEqual(len(second.context['page']), 2)
+        self.assertNotEqual(
+            [post.id for post in first.context['page']],
+            [post.id for post in second.context['page']]
+        )
 
     def test_folowing_auth_user(self):
         self.client_auth.force_login(self.user_auth)
@@ -227,3 +315,537 @@ class TestStringMethods(TestCase):
             follow=True
         )
         self.assertEqual(Comment.objects.count(),0)
+
+    def test_feed_queries_do_not_grow_with_posts(self):
+        Follow.objects.create(user=self.user, author=self.user_auth)
+        post = Post.objects.create(text="first", author=self.user, group=self.group)
+        Comment.objects.create(post=post, author=self.user, text="comment")
+        pages = {
+            'index': {},
+            'group_posts': {'slug': self.group.slug},
+            'profile': {"username": self.user.username},
+            'follow_index': {},
+            'post': {"username": self.user.username, "post_id": post.id},
+        }
+
+        def grow():
+            for author in (self.user, self.user_auth):
+                new = Post.objects.create(text="more", author=author, group=self.group)
+                Comment.objects.create(post=new, author=self.user_auth, text="comment")
+            Comment.objects.create(post=post, author=self.user_auth, text="comment")
+
+        for name, kwargs in pages.items():
+            with self.subTest(page=name):
+                query_budget.assert_view_budget(self.client, name, kwargs)
+                query_budget.assert_constant_queries(
+                    self.client, reverse(name, kwargs=kwargs), grow
+                )
+
+    def test_counters(self):
+        follow = Follow.objects.create(user=self.user_auth, author=self.user)
+        post = Post.objects.create(text="counted", author=self.user)
+        comment = Comment.objects.create(post=post, author=self.user_auth, text="c")
+        post.text = "edited"
+        post.save()
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(
+            (stats.followers_count, stats.following_count, stats.posts_count),
+            (1, 0, 1)
+        )
+        self.assertEqual(self.user_auth.stats.following_count, 1)
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 1)
+
+        comment.delete()
+        follow.delete()
+        stats.refresh_from_db()
+        self.assertEqual(stats.followers_count, 0)
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 0)
+
+    def test_rebuild_counters(self):
+        post = Post.objects.create(text="counted", author=self.user)
+        Comment.objects.create(post=post, author=self.user, text="c")
+        Follow.objects.create(user=self.user_auth, author=self.user)
+        UserStats.objects.all().update(followers_count=42, posts_count=42)
+        Post.objects.update(comments_count=42)
+        call_command('rebuild_counters', stdout=StringIO())
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.followers_count, stats.posts_count), (1, 1))
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 1)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_seed_data(self):
+        call_command(
+            'seed_data', users=20, groups=3, posts=200, comments=300, images=0,
+            follows=5, stdout=StringIO(),
+        )
+        seeded = Post.objects.filter(author__username__startswith='seed_user_')
+        self.assertEqual(seeded.count(), 200)
+        author = seeded.values('author').annotate(n=Count('id')).order_by('-n').first()
+        stats = UserStats.objects.get(user_id=author['author'])
+        self.assertEqual(stats.posts_count, author['n'])
+        # у популярного автора по степенному закону заметно больше постов
+        self.assertGreater(author['n'], 200 / 20 * 2)
+        reader = Follow.objects.values_list('user', flat=True).first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user_id=reader).count(),
+            Post.objects.filter(author__following__user_id=reader).count(),
+        )
+
+    def test_cursor_pagination(self):
+        posts = [
+            Post.objects.create(text=f"post {i}", author=self.user, group=self.group)
+            for i in range(12)
+        ]
+        url = reverse('group_posts', kwargs={'slug': self.group.slug})
+        pages = []
+        response = self.client.get(url)
+        self.assertIsNone(response.context['page'].previous_cursor)
+        while True:
+            page = response.context['page']
+            pages.append([post.id for post in page])
+            if not page.next_cursor:
+                break
+            response = self.client.get(url, {'after': page.next_cursor})
+        self.assertEqual(sum(pages, []), [post.id for post in reversed(posts)])
+        self.assertEqual([len(ids) for ids in pages], [5, 5, 2])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'before': page.previous_cursor})
+        self.assertEqual([post.id for post in response.context['page']], pages[1])
+        self.assertFalse(
+            [q['sql'] for q in queries if 'COUNT(' in q['sql'] or 'OFFSET' in q['sql']]
+        )
+
+    def test_follow_timeline(self):
+        self.client_auth.force_login(self.user_auth)
+        old_post = Post.objects.create(text="old post", author=self.user)
+        self.client_auth.get(reverse('profile_follow', kwargs={'username': self.user.username}))
+        new_post = Post.objects.create(text="new post", author=self.user)
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=self.user_auth).values_list('post_id', flat=True)),
+            {old_post.id, new_post.id}
+        )
+        response = self.client_auth.get(reverse('follow_index'))
+        self.assertEqual([post.id for post in response.context['page']], [new_post.id, old_post.id])
+
+        self.client_auth.get(reverse('profile_unfollow', kwargs={'username': self.user.username}))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user_auth).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_follow_timeline_fanout_on_read(self):
+        self.client_auth.force_login(self.user_auth)
+        Follow.objects.create(user=self.user_auth, author=self.user)
+        posts = [Post.objects.create(text=f"post {i}", author=self.user) for i in range(12)]
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.client_auth.get(reverse('follow_index'))
+        page = response.context['page']
+        self.assertEqual(len(page), 10)
+        response = self.client_auth.get(reverse('follow_index'), {'after': page.next_cursor})
+        self.assertEqual(
+            [post.id for post in response.context['page']],
+            [posts[1].id, posts[0].id]
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_follow_timeline_fanout_restored(self):
+        Follow.objects.create(user=self.user_auth, author=self.user)
+        Follow.objects.create(user=self.user_auth_fol, author=self.user)
+        # два подписчика при пределе 1: пост только подмешивается при чтении
+        heavy_post = Post.objects.create(text="heavy", author=self.user)
+        self.assertFalse(TimelineEntry.objects.filter(post=heavy_post).exists())
+
+        Follow.objects.filter(user=self.user_auth_fol, author=self.user).delete()
+        self.client_auth.force_login(self.user_auth)
+        response = self.client_auth.get(reverse('follow_index'))
+        self.assertEqual([post.id for post in response.context['page']], [heavy_post.id])
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user_auth, post=heavy_post).exists()
+        )
+
+    def test_follow_graph(self):
+        me, sarah, other = self.user_auth.pk, self.user.pk, self.user_auth_fol.pk
+        self.assertEqual(follow_graph.follow(me, [sarah, other, me]), sorted([sarah, other]))
+        self.assertEqual(follow_graph.follow(me, [sarah]), [])
+        Follow.objects.create(user=self.user, author=self.user_auth)
+        self.assertEqual(Follow.objects.filter(user=self.user_auth).count(), 2)
+        self.assertEqual(UserStats.objects.get(user=self.user_auth).following_count, 2)
+        self.assertEqual(UserStats.objects.get(user=self.user).followers_count, 1)
+
+        # первое обращение загружает массивы из БД, дальше - только кэш
+        follow_graph.mutual(me)
+        follow_graph.following(sarah)
+        follow_graph.followers(sarah)
+        with self.assertNumQueries(0):
+            self.assertTrue(follow_graph.follows(me, sarah))
+            self.assertFalse(follow_graph.follows(sarah, other))
+            self.assertEqual(list(follow_graph.followers(sarah)), [me])
+            self.assertEqual(follow_graph.mutual(me), [sarah])
+
+        self.assertEqual(follow_graph.unfollow(me, [sarah, sarah + 100]), [sarah])
+        self.assertEqual(follow_graph.mutual(me), [])
+        self.assertEqual(UserStats.objects.get(user=self.user).followers_count, 0)
+        # post_delete считает производные данные ровно один раз
+        self.assertEqual(UserStats.objects.get(user=self.user_auth).following_count, 1)
+
+        self.client_auth.force_login(self.user_auth)
+        response = self.client_auth.get(reverse('profile', kwargs={'username': self.user_auth_fol.username}))
+        self.assertTrue(response.context['following'])
+        self.client_auth.get(reverse('profile_unfollow', kwargs={'username': self.user_auth_fol.username}))
+        response = self.client_auth.get(reverse('profile_unfollow', kwargs={'username': self.user_auth_fol.username}))
+        self.assertEqual(response.status_code, 302)
+        response = self.client_auth.get(reverse('profile', kwargs={'username': self.user_auth_fol.username}))
+        self.assertFalse(response.context['following'])
+
+    def test_post_card_cache(self):
+        post = Post.objects.create(text="cached card", author=self.user)
+        edit_url = reverse('post_edit', kwargs={'username': self.user.username, 'post_id': post.id})
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, edit_url)
+        self.client_auth.force_login(self.user_auth)
+        response = self.client_auth.get(reverse('index'))
+        self.assertContains(response, post.text)
+        self.assertNotContains(response, edit_url)
+
+        self.client_auth.post(
+            reverse('add_comment', args=[self.user.username, post.id]), {'text': 'c'}
+        )
+        response = self.client_auth.get(reverse('index'))
+        self.assertContains(response, "1 комментариев")
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_thumbnail_placeholder(self):
+        file_obj = BytesIO()
+        Image.new("RGB", size=(50, 50), color=(255, 0, 0)).save(file_obj, 'png')
+        post = Post.objects.create(
+            author=self.user, text='text',
+            image=SimpleUploadedFile('thumb.png', file_obj.getvalue(), 'image/png'),
+        )
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, thumbnails.PLACEHOLDER_URL)
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, thumbnails.PLACEHOLDER_URL)
+        self.assertContains(response, thumbnails.lookup(post.image).url)
+
+        post.refresh_from_db()
+        self.assertEqual([v['width'] for v in post.variants()], [320, 640, 960])
+        self.assertContains(response, '{} 320w'.format(thumbnails.lookup(post.image, 'card_320').url))
+        self.assertContains(response, 'sizes="(max-width: 767px) 100vw, 825px"')
+        # с сохранёнными вариантами карточка не ходит в хранилище ключей sorl
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        self.assertFalse([q for q in queries if 'thumbnail_kvstore' in q['sql']])
+        post.image.delete()
+
+    def test_search(self):
+        post = Post.objects.create(text="Терминаторы вернулись в Лос-Анджелес", author=self.user)
+        Post.objects.create(text="Совсем другой текст", author=self.user)
+        self.assertEqual(list(search.search("терминатор")), [post])
+        self.assertEqual(list(search.search("терминаторов ЛОС")), [post])
+        self.assertFalse(search.search("терминатор кошка").exists())
+
+        response = self.client.get(reverse('search'), {'q': 'вернулась'})
+        self.assertEqual([p.id for p in response.context['page']], [post.id])
+
+        post.text = "Ничего общего"
+        post.save()
+        self.assertFalse(search.search("терминатор").exists())
+        post.delete()
+        self.assertFalse(search.search("ничего").exists())
+
+    @override_settings(POST_SEARCH_BACKEND='table')
+    def test_search_table_backend(self):
+        post = Post.objects.create(text="Ёлки зелёные", author=self.user)
+        self.assertEqual(list(search.search("елка")), [post])
+
+    def test_api_feeds(self):
+        posts = [
+            Post.objects.create(text=f"api {i}", author=self.user, group=self.group)
+            for i in range(3)
+        ]
+        url = reverse('api:group_posts', kwargs={'slug': self.group.slug})
+        response = self.client_not_auth.get(url, {'limit': 2})
+        data = response.json()
+        self.assertEqual([post['id'] for post in data['results']], [posts[2].id, posts[1].id])
+        self.assertEqual(data['results'][0]['author'], self.user.username)
+        self.assertIsNone(data['previous'])
+        response = self.client_not_auth.get(url, {'limit': 2, 'after': data['next']})
+        self.assertEqual([post['id'] for post in response.json()['results']], [posts[0].id])
+
+        etag = self.client_not_auth.get(url)['ETag']
+        response = self.client_not_auth.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(text="api new", author=self.user, group=self.group)
+        response = self.client_not_auth.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client_not_auth.get(reverse('api:follow_index')).status_code, 401)
+        self.client_auth.force_login(self.user_auth)
+        etag = self.client_auth.get(reverse('api:follow_index'))['ETag']
+        Follow.objects.create(user=self.user_auth, author=self.user)
+        response = self.client_auth.get(reverse('api:follow_index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_api_export_ndjson(self):
+        for i in range(3):
+            Post.objects.create(text=f"export {i}", author=self.user)
+        response = self.client_not_auth.get(
+            reverse('api:export_posts', kwargs={'username': self.user.username})
+        )
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)['text'] for line in lines], ["export 2", "export 1", "export 0"]
+        )
+
+    def test_conditional_get(self):
+        post = Post.objects.create(text="fresh", author=self.user, group=self.group)
+        urls = [
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.user.username}),
+            reverse('post', kwargs={'username': self.user.username, 'post_id': post.id}),
+        ]
+        # cookie csrftoken появляется после первой страницы с формой комментария
+        self.client.get(urls[-1])
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+        self.client.post(
+            reverse('post_edit', args=[self.user.username, post.id]),
+            {'text': 'edited', 'group': self.group.id}
+        )
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+        url = urls[-1]
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('add_comment', args=[self.user.username, post.id]), {'text': 'c'})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(urls[2])['ETag']
+        Follow.objects.create(user=self.user_auth, author=self.user)
+        self.assertEqual(self.client.get(urls[2], HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(JOB_QUEUE_MODE='db')
+    def test_job_queue(self):
+        Follow.objects.create(user=self.user_auth, author=self.user)
+        self.client.post(reverse('new_post'), {"text": "queued post"})
+        post = Post.objects.get(text="queued post")
+        self.assertEqual(
+            set(Job.objects.values_list('name', flat=True)),
+            {'timeline.push_post', 'search.index_post'}
+        )
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        # повторная постановка той же задачи не дублирует её
+        jobs.enqueue('timeline.push_post', post_id=post.id)
+        self.assertEqual(Job.objects.filter(name='timeline.push_post').count(), 1)
+
+        for job in jobs.claim('test', 10):
+            self.assertTrue(jobs.run(job))
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user_auth, post=post).exists())
+        self.assertEqual(list(search.search("queued")), [post])
+        self.assertEqual(Job.objects.exclude(status=Job.DONE).count(), 0)
+
+        failing = mock.Mock(side_effect=ValueError)
+        with mock.patch.dict(jobs.TASKS, {'test.fail': failing}), \
+                override_settings(JOB_QUEUE_MAX_ATTEMPTS=2, JOB_QUEUE_RETRY_DELAY=0):
+            job = jobs.enqueue('test.fail', value=1)
+            for _ in range(3):
+                for claimed in jobs.claim('test', 5):
+                    jobs.run(claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(failing.call_count, 2)
+        failing.assert_called_with(value=1)
+        stats = {row['name']: row for row in jobs.stats()}
+        self.assertEqual(stats['test.fail']['retries'], 1)
+        self.assertEqual(stats['search.index_post']['done'], 1)
+
+    @override_settings(
+        JOB_QUEUE_MODE='db', POST_THUMBNAIL_EXECUTOR='queue', MEDIA_ROOT=tempfile.mkdtemp()
+    )
+    def test_thumbnail_queue(self):
+        file_obj = BytesIO()
+        Image.new("RGB", size=(60, 40), color=(0, 0, 255)).save(file_obj, 'png')
+        upload = SimpleUploadedFile('queued.png', file_obj.getvalue(), 'image/png')
+        response = self.client.post(reverse('new_post'), {'text': 'queued image', 'image': upload})
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get(text='queued image')
+        job = Job.objects.get(name='thumbnails.generate')
+        self.assertEqual(json.loads(job.payload), {'name': post.image.name, 'post_id': post.id})
+        # до воркера лента отдаётся с заглушкой, а не с ошибкой
+        self.assertContains(self.client.get(reverse('index')), thumbnails.PLACEHOLDER_URL)
+
+        claimed = [job for job in jobs.claim('test', 10) if job.name == 'thumbnails.generate']
+        self.assertEqual(len(claimed), 1)
+        self.assertTrue(jobs.run(claimed[0]))
+        post.refresh_from_db()
+        self.assertEqual(len(post.variants()), 3)
+        self.assertNotContains(self.client.get(reverse('index')), thumbnails.PLACEHOLDER_URL)
+        post.image.delete()
+
+    @override_settings(DIGEST_BATCH_SIZE=1)
+    def test_digests(self):
+        Follow.objects.create(user=self.user_auth, author=self.user)
+        Follow.objects.create(user=self.user_auth_fol, author=self.user)
+        Follow.objects.create(user=self.user_auth_fol, author=self.user_auth)
+        first = Post.objects.create(text="first news", author=self.user)
+        second = Post.objects.create(text="second news", author=self.user_auth)
+        Post.objects.create(text="nobody follows", author=self.user_auth_fol)
+
+        self.assertEqual(digests.send(), 2)
+        letters = {letter.to[0]: letter.body for letter in mail.outbox}
+        self.assertEqual(set(letters), {self.user_auth.email, self.user_auth_fol.email})
+        self.assertIn(first.text, letters[self.user_auth.email])
+        self.assertNotIn(second.text, letters[self.user_auth.email])
+        body = letters[self.user_auth_fol.email]
+        self.assertLess(body.index(second.text), body.index(first.text))
+        self.assertIn(reverse('post', args=[self.user.username, first.id]), body)
+        self.assertNotIn("nobody follows", body)
+
+        # следующая рассылка начинается с конца предыдущей
+        self.assertEqual(digests.send(), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    @override_settings(COMMENTS_PER_PAGE=3)
+    def test_comment_pages(self):
+        post = Post.objects.create(text="viral", author=self.user)
+        comments = [
+            Comment.objects.create(post=post, author=self.user_auth, text=f"comment {i}")
+            for i in range(5)
+        ]
+        kwargs = {'username': self.user.username, 'post_id': post.id}
+        response = self.client.get(reverse('post', kwargs=kwargs))
+        self.assertEqual(list(response.context['items']), comments[:3])
+        self.assertContains(response, "comment 2")
+        self.assertNotContains(response, "comment 3")
+        more_url = reverse('post_comments', kwargs=kwargs)
+        self.assertContains(response, f"{more_url}?after={response.context['next_cursor']}")
+
+        response = self.client.get(more_url, {'after': response.context['next_cursor']})
+        self.assertEqual(list(response.context['items']), comments[3:])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, "<html")
+
+        data = self.client.get(more_url, {'format': 'json'}).json()
+        self.assertEqual([item['text'] for item in data['results']], ["comment 0", "comment 1", "comment 2"])
+        self.assertEqual(data['results'][0]['author'], self.user_auth.username)
+        data = self.client.get(more_url, {'format': 'json', 'after': data['next']}).json()
+        self.assertEqual([item['id'] for item in data['results']], [c.id for c in comments[3:]])
+        self.assertIsNone(data['next'])
+
+    def test_request_metrics(self):
+        metrics.registry.reset()
+        Post.objects.create(text="measured", author=self.user)
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        stats = metrics.registry.recent()['index']
+        self.assertEqual(stats.histograms['duration'].count, 2)
+        self.assertGreater(stats.histograms['queries'].sum, 0)
+        self.assertGreater(stats.histograms['template_time'].sum, 0)
+        # второй запрос берёт страницу ленты и карточку из кэша
+        self.assertEqual(stats.counters['cache_hits'], 2)
+
+        response = self.client.get(reverse('request_stats'))
+        self.assertEqual(response.status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('request_stats'))
+        self.assertContains(response, '<td>index</td>')
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'yatube_request_duration_seconds_count{view="index"} 2')
+
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            # 1 - NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    @override_settings(SQLITE_RETRY_DELAY=0)
+    def test_write_retry(self):
+        calls = []
+
+        def view(request):
+            calls.append(request)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'saved'
+
+        outside = mock.Mock(in_atomic_block=False)
+        with mock.patch('posts.writes.transaction.get_connection', return_value=outside):
+            self.assertEqual(writes.retry_locked(view)('request'), 'saved')
+            self.assertEqual(len(calls), 3)
+            calls.clear()
+            with override_settings(SQLITE_WRITE_RETRIES=1):
+                with self.assertRaises(OperationalError):
+                    writes.retry_locked(view)('request')
+            self.assertEqual(len(calls), 2)
+
+        # внутри внешней транзакции повторять нечего: её откатывает владелец
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            writes.retry_locked(view)('request')
+        self.assertEqual(len(calls), 1)
+
+    def test_production_checks(self):
+        from yatube import checks
+        from yatube.settings import production
+
+        # профиль разработки проверку не проходит, но и не включает её
+        self.assertEqual(checks.production_settings(), [])
+        # тестовый раннер выключает DEBUG: медленные настройки задаём явно,
+        # чтобы тест не зависел от окружения
+        with override_settings(PRODUCTION=True, DEBUG=True, JOB_QUEUE_MODE='sync',
+                               POST_THUMBNAIL_EXECUTOR='sync'):
+            ids = {error.id for error in checks.production_settings()}
+            self.assertTrue({'yatube.E001', 'yatube.E002', 'yatube.E004', 'yatube.E005',
+                             'yatube.E006', 'yatube.E007', 'yatube.E008'} <= ids)
+            with self.assertRaisesMessage(ImproperlyConfigured, 'yatube.E004'):
+                checks.enforce()
+        prod = {name: getattr(production, name) for name in (
+            'PRODUCTION', 'DEBUG', 'DATABASES', 'TEMPLATES', 'CACHES', 'JOB_QUEUE_MODE',
+            'POST_THUMBNAIL_EXECUTOR',
+        )}
+        with override_settings(SECRET_KEY='x' * 50, ALLOWED_HOSTS=['yatube.example'], **prod):
+            self.assertEqual(checks.production_settings(), [])
+            checks.enforce()
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        authors = [User.objects.create(username=f"author{i}") for i in range(50)]
+        cls.reader = User.objects.create_user(username="reader")
+        groups = [
+            Group.objects.create(title=f"group {i}", slug=f"group-{i}", description="d")
+            for i in range(10)
+        ]
+        Post.objects.bulk_create(
+            [
+                Post(text=f"post {i}", author=authors[i % 50], group=groups[i % 10])
+                for i in range(5000)
+            ],
+            batch_size=500,
+        )
+        for author in authors[:10]:
+            Follow.objects.create(user=cls.reader, author=author)
+        post = Post.objects.first()
+        Comment.objects.bulk_create(
+            [Comment(post=post, author=authors[i % 50], text="c") for i in range(500)]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_feeds_use_indexes(self):
+        post = Post.objects.order_by('pk')[2500]
+        for name, queryset in query_plans.feed_queries(post, self.reader).items():
+            with self.subTest(feed=name):
+                plan = query_plans.explain(queryset)
+                self.assertFalse(query_plans.uses_sort(plan), plan)
@@ -0,0 +1,278 @@
+"""Фоновая подготовка миниатюр картинок постов.
+
+Миниатюры всех размеров из POST_THUMBNAIL_SIZES генерируются в очереди
+задач jobs, в пуле потоков или процессов сразу после new_post и post_edit.
+Шаблоны только ищут готовую миниатюру в хранилище ключей sorl и, пока её
+нет, показывают заглушку вместо того, чтобы декодировать картинку внутри
+запроса. Готовые варианты карточки разной ширины (POST_IMAGE_VARIANTS)
+записываются в Post.image_variants, и карточка строит по ним srcset без
+обращений к хранилищу ключей и к файлам.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBKVStore
+from sorl.thumbnail.models import KVStore
+
+from . import cards, feed_cache, freshness, jobs, media
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'card_640': ('640x226', {'crop': 'center', 'upscale': True}),
+    'card_320': ('320x113', {'crop': 'center', 'upscale': True}),
+}
+# размеры карточки для srcset, от узкой к широкой
+DEFAULT_VARIANTS = ('card_320', 'card_640', 'card')
+DEFAULT_SIZES_ATTR = '(max-width: 767px) 100vw, 825px'
+PLACEHOLDER_URL = (
+    'data:image/svg+xml,%3Csvg%20xmlns=%22http://www.w3.org/2000/svg%22'
+    '%20width=%22960%22%20height=%22339%22%3E%3Crect%20width=%22100%25%22'
+    '%20height=%22100%25%22%20fill=%22%23e9ecef%22/%3E%3C/svg%3E'
+)
+FAILED_TIMEOUT = 60 * 60
+
+_lock = threading.Lock()
+_pending = set()
+_executor = None
+
+
+class Placeholder:
+    url = PLACEHOLDER_URL
+    is_placeholder = True
+
+
+class CardImage:
+    """Картинка карточки из сохранённых вариантов: src, srcset и размеры."""
+    is_placeholder = False
+
+    def __init__(self, variants):
+        largest = variants[-1]
+        self.url = largest['url']
+        self.width = largest['width']
+        self.height = largest['height']
+        self.srcset = ', '.join(f"{v['url']} {v['width']}w" for v in variants)
+        self.sizes = getattr(settings, 'POST_IMAGE_SIZES_ATTR', DEFAULT_SIZES_ATTR)
+
+
+def sizes():
+    return getattr(settings, 'POST_THUMBNAIL_SIZES', DEFAULT_SIZES)
+
+
+def mode():
+    return getattr(settings, 'POST_THUMBNAIL_EXECUTOR', 'queue')
+
+
+def variant_aliases():
+    return getattr(settings, 'POST_IMAGE_VARIANTS', DEFAULT_VARIANTS)
+
+
+def failed_key(name):
+    return f'thumbnail:failed:{name}'
+
+
+class LookupBackend(ThumbnailBackend):
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры с тем именем, которое дал бы ей get_thumbnail."""
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def lookup(self, file_, geometry_string, **options):
+        """Готовая миниатюра из хранилища ключей или None, без генерации."""
+        return default.kvstore.get(self.thumbnail_file(file_, geometry_string, **options))
+
+
+backend = LookupBackend()
+
+
+def source(image):
+    """Исходник для sorl с хранилищем поля Post.image.
+
+    Ключ миниатюры в sorl включает хранилище исходника. Голое имя sorl
+    считает файлом default_storage, и ключи разошлись бы с теми, что
+    получаются из FieldFile при показе карточки.
+    """
+    if isinstance(image, str):
+        return ImageFile(image, media.storage())
+    return image
+
+
+def lookup(image, alias='card'):
+    geometry, options = sizes()[alias]
+    return backend.lookup(source(image), geometry, **dict(options))
+
+
+def prefetch(posts, alias='card'):
+    """Ищет миниатюры постов разом и запоминает их в post._thumbnails.
+
+    sorl читает кэш и при промахе таблицу thumbnail_kvstore отдельно для
+    каждой картинки; здесь на всю страницу одно get_many и один запрос.
+    """
+    # постам с сохранёнными вариантами хранилище ключей не нужно
+    posts = [post for post in posts if post.image and not post.image_variants]
+    kvstore = default.kvstore
+    if not posts or not isinstance(kvstore, CachedDBKVStore):
+        return
+    geometry, options = sizes()[alias]
+    keys = {
+        post.pk: add_prefix(backend.thumbnail_file(post.image, geometry, **dict(options)).key)
+        for post in posts
+    }
+    values = kvstore.cache.get_many(set(keys.values()))
+    missing = set(keys.values()) - set(values)
+    if missing:
+        found = dict(KVStore.objects.filter(key__in=missing).values_list('key', 'value'))
+        # как и sorl, запоминаем в кэше и отсутствие записи
+        loaded = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(loaded, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(loaded)
+    for post in posts:
+        value = values[keys[post.pk]]
+        thumbnail = None if value == EMPTY_VALUE else deserialize_image_file(value)
+        post.__dict__.setdefault('_thumbnails', {})[alias] = thumbnail
+
+
+def generate(name):
+    """Генерирует все размеры; True, если миниатюры готовы."""
+    image = source(name)
+    try:
+        for geometry, options in sizes().values():
+            get_thumbnail(image, geometry, **dict(options))
+        return all(
+            backend.lookup(image, geometry, **dict(options))
+            for geometry, options in sizes().values()
+        )
+    except Exception:
+        logger.exception('Не удалось сделать миниатюры для %s', name)
+        return False
+
+
+def generate_in_pool(name):
+    try:
+        return generate(name)
+    finally:
+        # у потоков и процессов пула свои соединения с БД, закрываем их
+        connections.close_all()
+
+
+def _close_connections():
+    connections.close_all()
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            workers = getattr(settings, 'POST_THUMBNAIL_WORKERS', 2)
+            if mode() == 'process':
+                _executor = ProcessPoolExecutor(workers, initializer=_close_connections)
+            else:
+                _executor = ThreadPoolExecutor(workers, thread_name_prefix='thumbnails')
+    return _executor
+
+
+def variants(name):
+    """Готовые варианты для srcset по возрастанию ширины или None."""
+    result = []
+    for alias in variant_aliases():
+        thumbnail = lookup(name, alias)
+        if not thumbnail:
+            return None
+        result.append({'url': thumbnail.url, 'width': thumbnail.width, 'height': thumbnail.height})
+    return sorted(result, key=lambda variant: variant['width'])
+
+
+def store_variants(name):
+    """Записывает варианты во все посты с этой картинкой; их id."""
+    found = variants(name)
+    if not found:
+        return []
+    posts = Post.objects.filter(image=name)
+    post_ids = list(posts.values_list('pk', flat=True))
+    posts.update(image_variants=json.dumps(found))
+    return post_ids
+
+
+def finish(name, post_id, ready):
+    with _lock:
+        _pending.discard(name)
+    if ready:
+        cache.delete(failed_key(name))
+        # карточки с заглушкой в кэше больше не нужны, а страницы
+        # с ними не должны отвечать 304
+        for pk in set(store_variants(name)) | {post_id}:
+            cards.bump(pk)
+        # в кэше лент лежат посты ещё без вариантов
+        feed_cache.bump_version()
+        freshness.touch(freshness.ALL)
+    else:
+        cache.set(failed_key(name), True, FAILED_TIMEOUT)
+
+
+def schedule(post):
+    """Ставит генерацию миниатюр картинки поста в очередь пула."""
+    if not post.image:
+        return
+    name = post.image.name
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    if mode() == 'sync':
+        finish(name, post.pk, generate(name))
+        return
+    if mode() == 'queue':
+        # повторы не дублируются: очередь сама пропускает такую же задачу
+        with _lock:
+            _pending.discard(name)
+        jobs.enqueue('thumbnails.generate', name=name, post_id=post.pk)
+        return
+    future = executor().submit(generate_in_pool, name)
+    future.add_done_callback(
+        lambda done: finish(name, post.pk, not done.exception() and done.result())
+    )
+
+
+def card_image(post):
+    """Картинка карточки: сохранённые варианты, а без них - card_thumbnail()."""
+    found = post.variants()
+    if found:
+        return CardImage(found)
+    return card_thumbnail(post)
+
+
+def card_thumbnail(post, alias='card'):
+    """Готовая миниатюра для карточки или заглушка, пока её готовят."""
+    prefetched = getattr(post, '_thumbnails', {})
+    if alias in prefetched:
+        thumbnail = prefetched[alias]
+    else:
+        thumbnail = lookup(post.image, alias)
+    if thumbnail:
+        return thumbnail
+    if not cache.get(failed_key(post.image.name)):
+        schedule(post)
+    return Placeholder()
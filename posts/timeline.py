@@ -0,0 +1,148 @@
+"""Материализованные ленты подписок (fan-out-on-write).
+
+Новый пост раскладывается по лентам подписчиков автора, а follow_index читает
+только свою ленту диапазоном по индексу. Посты авторов, у которых подписчиков
+больше TIMELINE_FANOUT_LIMIT, по лентам не раскладываются и подмешиваются
+при чтении (fan-out-on-read).
+
+Посты, написанные, пока автор был выше предела, есть только в таблице постов.
+Когда отписки возвращают автора под предел, restore_fanout() раскладывает
+его посты по лентам всех подписчиков, иначе они пропали бы из follow_index.
+Сам TIMELINE_FANOUT_LIMIT так не отслеживается: после его изменения нужен
+manage.py rebuild_timelines.
+"""
+from django.conf import settings
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .pagination import keyset_window
+
+# SQLite в Django 2.2 вставляет пачку одним составным SELECT: не больше 500 строк
+BATCH_SIZE = 500
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 1000)
+
+
+def is_fanout_author(author_id):
+    stats = UserStats.objects.filter(user_id=author_id).first()
+    if stats is None:
+        stats = UserStats.objects.rebuild(author_id)
+    return stats.followers_count <= fanout_limit()
+
+
+def push_post(post):
+    if not is_fanout_author(post.author_id):
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True
+    )
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id, post_id=post.pk,
+                author_id=post.author_id, pub_date=post.pub_date,
+            )
+            for user_id in followers.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    if not is_fanout_author(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list('pk', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id, post_id=post_id,
+                author_id=author_id, pub_date=pub_date,
+            )
+            for post_id, pub_date in posts.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_many(user_id, author_ids):
+    """backfill() для нескольких авторов сразу: один SELECT постов и пачки INSERT."""
+    authors = UserStats.objects.filter(
+        user_id__in=author_ids, followers_count__lte=fanout_limit()
+    ).values_list('user_id', flat=True)
+    posts = Post.objects.filter(author_id__in=list(authors)).values_list(
+        'pk', 'author_id', 'pub_date'
+    )
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id, post_id=post_id,
+                author_id=author_id, pub_date=pub_date,
+            )
+            for post_id, author_id, pub_date in posts.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def crossed_below_limit(author_ids):
+    """Авторы, которых последняя отписка вернула ровно к пределу раскладки."""
+    return list(
+        UserStats.objects.filter(
+            user_id__in=author_ids, followers_count=fanout_limit()
+        ).values_list('user_id', flat=True)
+    )
+
+
+def restore_fanout(author_id):
+    """Раскладывает все посты автора по лентам всех его подписчиков."""
+    if not is_fanout_author(author_id):
+        return
+    followers = list(
+        Follow.objects.filter(author_id=author_id).values_list('user_id', flat=True)
+    )
+    posts = Post.objects.filter(author_id=author_id).values_list('pk', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id, post_id=post_id,
+                author_id=author_id, pub_date=pub_date,
+            )
+            for post_id, pub_date in posts.iterator()
+            for user_id in followers
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune_many(user_id, author_ids):
+    TimelineEntry.objects.filter(user_id=user_id, author_id__in=author_ids).delete()
+
+
+def heavy_authors(user_id):
+    return list(
+        Follow.objects.filter(
+            user_id=user_id, author__stats__followers_count__gt=fanout_limit()
+        ).values_list('author_id', flat=True)
+    )
+
+
+def window(user, cursor, limit, newer=False):
+    """Окно ленты подписок для paginate_feed."""
+    keys = keyset_window(
+        TimelineEntry.objects.filter(user=user).values_list('pub_date', 'post_id'),
+        cursor, limit, newer=newer, tiebreak='post_id',
+    )
+    authors = heavy_authors(user.pk)
+    if authors:
+        keys += keyset_window(
+            Post.objects.filter(author_id__in=authors).values_list('pub_date', 'pk'),
+            cursor, limit, newer=newer,
+        )
+        keys = sorted(set(keys), reverse=not newer)[:limit]
+    posts = Post.objects.for_feed().in_bulk([post_id for _, post_id in keys])
+    return [posts[post_id] for _, post_id in keys if post_id in posts]
@@ -0,0 +1,14 @@
+"""Значения версий и поколений для ключей кэша."""
+import time
+import uuid
+
+
+def new_version():
+    """Новое уникальное значение версии.
+
+    Версия меняется заменой значения, а не incr(): у file и db бэкендов
+    incr() не атомарен, и два параллельных сброса могли бы получить одну
+    и ту же версию. Время в начале значения не даёт вернуться к версии,
+    под которой лежат старые записи.
+    """
+    return '{:x}{}'.format(int(time.time() * 1000000), uuid.uuid4().hex[:8])
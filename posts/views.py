@@ -1,17 +1,22 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required 
-from .models import Post, Group, User, Follow
+from .models import Post, Group, User, UserStats
 from .forms import PostForm, CommentForm
-from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
+from . import feed_cache, follow_graph, freshness, metrics, search, thumbnails, timeline
+from .writes import retry_locked, write_transaction
+from .pagination import paginate_comments, paginate_feed
 
 
-@cache_page(60 * 1)
+@freshness.conditional(freshness.index_state)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed()
+    paginator, page = feed_cache.cached_feed(request, 'index', post_list, 10)
     return render(
         request,
         'index.html',
@@ -19,65 +24,115 @@ def index(request):
     )
  
  
+@freshness.conditional(freshness.group_state)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.group_posts.order_by('-pub_date').all()
-    paginator = Paginator(posts, 5)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = group.group_posts.for_feed()
+    paginator, page = feed_cache.cached_feed(request, f'group:{group.pk}', posts, 5)
     return render(
         request, "group.html",
-        {"group": group, "posts":posts, 'page': page, 'paginator': paginator}
+        {"group": group, 'page': page, 'paginator': paginator}
+    )
+
+
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    posts = search.search(query, Post.objects.for_feed())
+    paginator, page = paginate_feed(request, posts, 10)
+    return render(
+        request, 'search.html',
+        {'query': query, 'page': page, 'paginator': paginator}
     )
 
 
 @login_required
+@retry_locked
 def new_post(request):
     form = PostForm(request.POST, files=request.FILES or None)
     if request.method != 'POST':
         return render(request, 'new.html', {'form':form})
     if form.is_valid():
-        post_get = form.save(commit=False)
-        post_get.author = request.user
-        post_get.save()
+        # пост, счётчики и задачи очереди - одной короткой транзакцией
+        with write_transaction():
+            post_get = form.save(commit=False)
+            post_get.author = request.user
+            post_get.save()
+            thumbnails.schedule(post_get)
         return redirect('index')
     return render(request, 'new.html', {'form':form})
 
 
+@freshness.conditional(freshness.profile_state)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    author_posts = author.author_posts.all()
-    paginator = Paginator(author_posts, 5)
-    page = paginator.get_page(request.GET.get('page'))
+    paginator, page = feed_cache.cached_feed(
+        request, f'profile:{author.pk}', author.author_posts.for_feed(), 5
+    )
     following = False
-    if request.user.__class__.__name__ != 'AnonymousUser':
-        following = Follow.objects.filter(author=author, user=request.user).exists()
+    if request.user.is_authenticated:
+        following = follow_graph.follows(request.user.pk, author.pk)
     context = {
         'page': page,
         'paginator': paginator,
         'author': author,
         'following': following,
-        'author_posts': author_posts,
+        'stats': UserStats.objects.for_user(author),
         }
     return render(request, 'profile.html', context)
  
  
+def comments_per_page():
+    return getattr(settings, 'COMMENTS_PER_PAGE', 20)
+
+
+@freshness.conditional(freshness.post_state)
 def post_view(request, username, post_id):
     author = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id, author__username=username)
-    posts_count = author.author_posts
-    items = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.for_feed(), pk=post_id, author__username=username
+    )
+    items, next_cursor = paginate_comments(
+        request, post.comments.select_related('author'), comments_per_page()
+    )
     context = {
-        'author_posts': posts_count,
+        'stats': UserStats.objects.for_user(author),
         'post': post,
         'author': author,
         'form': CommentForm(),
         'items': items,
+        'next_cursor': next_cursor,
     }
     return render(request, 'post.html', context)
 
 
+@freshness.conditional(freshness.post_state)
+def post_comments(request, username, post_id):
+    """Следующие страницы комментариев: HTML-фрагмент или ?format=json."""
+    post = get_object_or_404(Post, pk=post_id, author__username=username)
+    items, next_cursor = paginate_comments(
+        request, post.comments.select_related('author'), comments_per_page()
+    )
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [
+                {
+                    'id': item.pk,
+                    'author': item.author.username,
+                    'text': item.text,
+                    'created': item.created,
+                }
+                for item in items
+            ],
+            'next': next_cursor,
+        }, json_dumps_params={'ensure_ascii': False})
+    return render(
+        request, 'item/comment_list.html',
+        {'post': post, 'items': items, 'next_cursor': next_cursor}
+    )
+
+
 @login_required
+@retry_locked
 def post_edit(request, username, post_id):
     profile = get_object_or_404(User, username=username)
     post = get_object_or_404(Post, pk=post_id, author__username=username)
@@ -91,8 +146,10 @@ def post_edit(request, username, post_id):
     
     if request.method == 'POST':
         if form.is_valid():
-            post = form.save(commit=False)
-            post.save()
+            with write_transaction():
+                post = form.save(commit=False)
+                post.save()
+                thumbnails.schedule(post)
             return redirect('post', username=post.author, post_id=post.id)
         return render(request, 'new.html', form_content)
     
@@ -100,22 +157,23 @@ def post_edit(request, username, post_id):
 
 
 @login_required
+@retry_locked
 def add_comment(request, username, post_id):
     post = get_object_or_404(Post, author__username=username, pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        comment = form.save(commit=False) 
-        comment.post = post 
-        comment.author = request.user 
-        comment.save()
+        with write_transaction():
+            comment = form.save(commit=False) 
+            comment.post = post 
+            comment.author = request.user 
+            comment.save()
     return redirect('post', username=username, post_id=post_id)
 
 @login_required
 def follow_index(request):
-    posts_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    paginator, page = paginate_feed(
+        request, partial(timeline.window, request.user), 10
+    )
     context = {
         'page':page,
         'paginator':paginator,
@@ -123,20 +181,38 @@ def follow_index(request):
     return render(request, "follow.html", context)
 
 @login_required
+@retry_locked
 def profile_follow(request, username):
-    user = request.user
     author = get_object_or_404(User, username=username)
-    if user != author:
-        follow = Follow.objects.get_or_create(user=user, author=author)   
+    follow_graph.follow(request.user.pk, [author.pk])
     return redirect('profile', username=username)
 
 @login_required
+@retry_locked
 def profile_unfollow(request, username):
-    unfollow_profile = Follow.objects.get(author__username=username, user=request.user)
-    unfollow_profile.delete()
+    author = get_object_or_404(User, username=username)
+    follow_graph.unfollow(request.user.pk, [author.pk])
     return redirect('profile', username=username)
 
 
+@staff_member_required
+def request_stats(request):
+    return render(
+        request,
+        'stats.html',
+        {'rows': metrics.summary(), 'window': metrics.window() // 60}
+    )
+
+
+def prometheus_metrics(request):
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in allowed:
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
 def page_not_found(request, exception):
     return render(
         request, 
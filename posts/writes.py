@@ -0,0 +1,64 @@
+"""Короткие транзакции записи и повтор при занятой SQLite.
+
+Запись поста или комментария - это строка модели, счётчики, задачи
+очереди и ссылки на картинки. write_transaction() объединяет их в одну
+транзакцию, которая с бэкендом yatube.db.sqlite3 сразу берёт блокировку
+записи (BEGIN IMMEDIATE). Если другой воркер держит её дольше
+busy_timeout, SQLite отвечает «database is locked»; retry_locked
+откатывает транзакцию и выполняет view заново, до SQLITE_WRITE_RETRIES
+раз с растущей паузой. Внутри чужой транзакции (тесты, вложенные вызовы)
+повтора нет: откатить можно только всю внешнюю транзакцию.
+"""
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+LOCKED_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def retries():
+    return getattr(settings, 'SQLITE_WRITE_RETRIES', 3)
+
+
+def retry_delay(attempt):
+    # 50 мс, 100 мс, 200 мс... с разбросом, чтобы воркеры не сталкивались снова
+    base = getattr(settings, 'SQLITE_RETRY_DELAY', 0.05) * 2 ** (attempt - 1)
+    return base * random.uniform(0.5, 1.5)
+
+
+def is_locked(error):
+    return any(message in str(error) for message in LOCKED_MESSAGES)
+
+
+@contextmanager
+def write_transaction(using=None):
+    """atomic(), который на SQLite сразу берёт блокировку записи."""
+    connection = transaction.get_connection(using)
+    connection.begin_immediate = not connection.in_atomic_block
+    try:
+        with transaction.atomic(using=using):
+            connection.begin_immediate = False
+            yield
+    finally:
+        connection.begin_immediate = False
+
+
+def retry_locked(view):
+    """Повторяет view, если её транзакцию записи не пустила блокировка SQLite."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return view(request, *args, **kwargs)
+            except OperationalError as error:
+                connection = transaction.get_connection()
+                if not is_locked(error) or connection.in_atomic_block or attempt >= retries():
+                    raise
+                attempt += 1
+                time.sleep(retry_delay(attempt))
+    return wrapper
@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture
+def assert_max_queries():
+    from posts.query_budget import assert_max_queries
+    return assert_max_queries
+
+
+@pytest.fixture
+def assert_view_budget():
+    from posts.query_budget import assert_view_budget
+    return assert_view_budget
+
+
+@pytest.fixture
+def assert_constant_queries():
+    from posts.query_budget import assert_constant_queries
+    return assert_constant_queries
@@ -0,0 +1,92 @@
+from io import BytesIO
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from PIL import Image
+
+
+@pytest.fixture
+def feed(user, group, django_user_model, settings, tmp_path):
+    from posts.models import Follow
+    settings.POST_THUMBNAIL_EXECUTOR = 'sync'
+    # картинки и миниатюры - во временный каталог, а не в media/ проекта
+    settings.MEDIA_ROOT = str(tmp_path)
+    reader = django_user_model.objects.create_user(username='Reader', password='1234567')
+    Follow.objects.create(user=reader, author=user)
+    return reader
+
+
+def small_image():
+    content = BytesIO()
+    Image.new('RGB', (40, 30), (200, 40, 40)).save(content, 'JPEG')
+    return SimpleUploadedFile('small.jpg', content.getvalue(), content_type='image/jpeg')
+
+
+def add_posts(user, group, reader, count=3):
+    from posts import thumbnails
+    from posts.models import Comment, Post
+    posts = []
+    for i in range(count):
+        post = Post.objects.create(
+            text=f'Пост {i}', author=user, group=group, image=small_image()
+        )
+        # миниатюры готовы до замера: бюджет считает только саму страницу
+        thumbnails.schedule(post)
+        Comment.objects.create(post=post, author=reader, text='Комментарий')
+        posts.append(post)
+    return posts
+
+
+def feed_urls(user, group):
+    return {
+        'index': reverse('index'),
+        'group_posts': reverse('group_posts', kwargs={'slug': group.slug}),
+        'profile': reverse('profile', kwargs={'username': user.username}),
+        'follow_index': reverse('follow_index'),
+    }
+
+
+class TestQueryBudget:
+
+    @pytest.mark.django_db
+    def test_feeds_within_budget(self, client, user, group, feed, assert_view_budget):
+        add_posts(user, group, feed, 10)
+        client.force_login(feed)
+        assert_view_budget(client, 'index')
+        assert_view_budget(client, 'group_posts', {'slug': group.slug})
+        assert_view_budget(client, 'profile', {'username': user.username})
+        assert_view_budget(client, 'follow_index')
+
+    @pytest.mark.django_db
+    def test_feed_queries_do_not_grow(self, client, user, group, feed, assert_constant_queries):
+        add_posts(user, group, feed, 1)
+        client.force_login(feed)
+        for name, url in feed_urls(user, group).items():
+            assert_constant_queries(client, url, lambda: add_posts(user, group, feed, 2))
+
+    @pytest.mark.django_db
+    def test_post_view_queries_do_not_grow(self, client, user, group, feed,
+                                           assert_view_budget, assert_constant_queries):
+        from posts.models import Comment
+        post = add_posts(user, group, feed, 1)[0]
+        client.force_login(feed)
+        kwargs = {'username': user.username, 'post_id': post.id}
+        assert_view_budget(client, 'post', kwargs)
+
+        def comment():
+            for i in range(3):
+                Comment.objects.create(post=post, author=feed, text=f'Ещё {i}')
+
+        assert_constant_queries(client, reverse('post', kwargs=kwargs), comment)
+
+    @pytest.mark.django_db
+    def test_budget_failure_lists_sql(self, user, assert_max_queries):
+        from posts.models import Post
+        with pytest.raises(AssertionError) as error:
+            with assert_max_queries(1, label='two queries'):
+                Post.objects.count()
+                Post.objects.count()
+        assert 'two queries: 2' in str(error.value)
+        assert 'SELECT COUNT(*)' in str(error.value)
+        assert '2 x SELECT COUNT(*)' in str(error.value)
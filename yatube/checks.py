@@ -0,0 +1,88 @@
+"""Проверка продакшен-настроек при запуске.
+
+С PRODUCTION = True (yatube.settings.production) production_settings()
+возвращает ошибку на каждую медленную или небезопасную настройку
+разработки. Проверка зарегистрирована в системе проверок Django
+(видна в manage.py check), а wsgi.py вызывает enforce(), который
+не даёт приложению стартовать с такими настройками.
+"""
+from django.conf import settings
+from django.core.checks import Error, register
+from django.core.exceptions import ImproperlyConfigured
+
+from yatube.settings import base
+
+CACHED_LOADER = 'django.template.loaders.cached.Loader'
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def template_loaders(template):
+    loaders = template.get('OPTIONS', {}).get('loaders') or []
+    return [loader[0] if isinstance(loader, (list, tuple)) else loader for loader in loaders]
+
+
+@register('yatube')
+def production_settings(app_configs=None, **kwargs):
+    if not getattr(settings, 'PRODUCTION', False):
+        return []
+    errors = []
+    if settings.DEBUG:
+        errors.append(Error('DEBUG включён.', id='yatube.E001'))
+    if settings.SECRET_KEY == base.SECRET_KEY:
+        errors.append(Error(
+            'SECRET_KEY взят из профиля разработки.',
+            hint='Задайте DJANGO_SECRET_KEY.', id='yatube.E002',
+        ))
+    if not settings.ALLOWED_HOSTS:
+        errors.append(Error(
+            'ALLOWED_HOSTS пуст.', hint='Задайте YATUBE_ALLOWED_HOSTS.', id='yatube.E003',
+        ))
+    for alias, database in settings.DATABASES.items():
+        if not database.get('CONN_MAX_AGE'):
+            errors.append(Error(
+                f'БД {alias}: соединение открывается на каждый запрос.',
+                hint='Задайте CONN_MAX_AGE (YATUBE_DB_CONN_MAX_AGE).', id='yatube.E004',
+            ))
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            errors.append(Error(
+                f'БД {alias}: SQLite без WAL, читатели ждут записи.',
+                hint='Используйте ENGINE yatube.db.sqlite3.', id='yatube.E009',
+            ))
+    for template in settings.TEMPLATES:
+        if template.get('APP_DIRS') or CACHED_LOADER not in template_loaders(template):
+            errors.append(Error(
+                f'Шаблоны {template["BACKEND"]} читаются с диска на каждый рендер.',
+                hint=f'Уберите APP_DIRS и включите {CACHED_LOADER}.', id='yatube.E005',
+            ))
+    for alias, cache in settings.CACHES.items():
+        if cache['BACKEND'] in PROCESS_CACHES:
+            errors.append(Error(
+                f'Кэш {alias} живёт в памяти процесса и не общий для воркеров.',
+                hint='Задайте YATUBE_CACHE.', id='yatube.E006',
+            ))
+    if getattr(settings, 'JOB_QUEUE_MODE', 'db') == 'sync':
+        errors.append(Error(
+            'Фоновые задачи выполняются прямо в запросе (JOB_QUEUE_MODE = sync).',
+            id='yatube.E007',
+        ))
+    if getattr(settings, 'POST_THUMBNAIL_EXECUTOR', 'queue') == 'sync':
+        errors.append(Error(
+            'Миниатюры генерируются прямо в запросе (POST_THUMBNAIL_EXECUTOR = sync).',
+            id='yatube.E008',
+        ))
+    return errors
+
+
+def enforce():
+    """Падает с ImproperlyConfigured, если продакшен запущен с настройками разработки."""
+    errors = production_settings()
+    if errors:
+        raise ImproperlyConfigured(
+            'Продакшен запущен с настройками разработки:\n' + '\n'.join(
+                f'  {error.id}: {error.msg}' + (f' {error.hint}' if error.hint else '')
+                for error in errors
+            )
+        )
@@ -0,0 +1,43 @@
+"""SQLite для нескольких воркеров: ENGINE = 'yatube.db.sqlite3'.
+
+Стандартный бэкенд Django, у которого каждое новое соединение получает
+DEFAULT_PRAGMAS (или SQLITE_PRAGMAS из настроек): журнал WAL (читатели не ждут писателя и наоборот),
+synchronous = NORMAL (в WAL fsync только при контрольной точке),
+mmap_size и cache_size для чтения страниц из памяти и busy_timeout -
+сколько ждать чужую запись, прежде чем вернуть «database is locked».
+
+posts.writes.write_transaction() открывает транзакцию через BEGIN
+IMMEDIATE: блокировка записи берётся сразу, а не при первом UPDATE,
+поэтому две транзакции не упираются друг в друга посреди работы
+(такую ошибку SQLite возвращает сразу, не дожидаясь busy_timeout).
+"""
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # отрицательное значение - в килобайтах, а не в страницах
+    'cache_size': -64 * 1024,
+    # столько миллисекунд соединение ждёт чужую запись
+    'busy_timeout': 5000,
+}
+
+
+def pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # write_transaction() выставляет флаг перед внешним atomic()
+    begin_immediate = False
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in pragmas().items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
@@ -0,0 +1,6 @@
+"""Настройки yatube.
+
+yatube.settings - профиль разработки (base), на нём же идут тесты.
+Продакшен запускается с DJANGO_SETTINGS_MODULE=yatube.settings.production.
+"""
+from .base import *  # noqa: F401,F403
@@ -0,0 +1,275 @@
+"""
+Django settings for yatube project: общая часть и профиль разработки.
+
+Generated by 'django-admin startproject' using Django 2.2.
+Продакшен-профиль - yatube.settings.production.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/2.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/2.2/ref/settings/
+"""
+
+import os
+
+# Build paths inside the project like this: os.path.join(BASE_DIR, ...)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = 'yu!2#x7u#p6)%*%v41((&*z4$8hffthkzw1*+erp)%x=*660%h'
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = True
+
+# профиль production включает проверку настроек при запуске (yatube.checks)
+PRODUCTION = False
+
+ALLOWED_HOSTS = [
+        "localhost",
+        "127.0.0.1",
+        "[::1]",
+        "testserver",
+]
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'users',
+    'posts',
+    'django.contrib.sites',
+    'django.contrib.flatpages',
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'sorl.thumbnail',
+]
+
+SITE_ID = 1
+
+MIDDLEWARE = [
+    'posts.middleware.MetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'yatube.urls'
+
+TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
+TEMPLATES = [
+    {
+        # стандартный DjangoTemplates с замером времени рендеринга
+        "BACKEND": "posts.metrics.DjangoTemplates",
+        "DIRS": [TEMPLATES_DIR],
+        "APP_DIRS": True,
+        "OPTIONS": {
+            "context_processors": [
+                "django.template.context_processors.debug",
+                "django.template.context_processors.request",
+                'yatube.context_processors.year',
+                "django.contrib.auth.context_processors.auth",
+                "django.contrib.messages.context_processors.messages",
+            ]
+        },
+    }
+]
+
+WSGI_APPLICATION = 'yatube.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/2.2/ref/settings/#databases
+
+# yatube.db.sqlite3 - стандартный бэкенд SQLite с журналом WAL и прагмами
+# для каждого соединения; SQLITE_PRAGMAS заменяет DEFAULT_PRAGMAS из
+# yatube/db/sqlite3/base.py
+DATABASES = {
+    'default': {
+        'ENGINE': 'yatube.db.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    }
+}
+
+# new_post, post_edit, add_comment и подписки повторяются, если SQLite так и не
+# отдала блокировку записи; пауза удваивается с каждой попыткой
+SQLITE_WRITE_RETRIES = 3
+SQLITE_RETRY_DELAY = 0.05
+
+
+# Password validation
+# https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/2.2/topics/i18n/
+
+LANGUAGE_CODE = 'ru'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_L10N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/2.2/howto/static-files/
+
+STATIC_URL = '/static/'
+
+STATIC_ROOT = os.path.join(BASE_DIR, "static")
+
+# Login
+
+LOGIN_URL = "/auth/login/"
+LOGIN_REDIRECT_URL = "index" 
+#LOGOUT_REDIRECT_URL = "index"
+
+#  подключаем движок filebased.EmailBackend
+EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
+# указываем директорию, в которую будут складываться файлы писем
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
+
+# подписчики получают не письмо на каждый пост, а дайджест за окно:
+# manage.py send_digests по расписанию раз в DIGEST_WINDOW секунд
+DIGEST_WINDOW = 24 * 60 * 60
+DIGEST_BATCH_SIZE = 500
+DIGEST_POSTS_PER_AUTHOR = 5
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/2.2/howto/static-files/
+
+STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Кэш выбирается переменной окружения YATUBE_CACHE:
+#   locmem    - память процесса, у каждого воркера свой кэш (по умолчанию)
+#   file      - общий каталог на диске, работает без внешних сервисов
+#   db        - таблица в основной БД (SQLite), нужен manage.py createcachetable
+#   memcached - нужен пакет python-memcached
+#   redis     - нужен пакет django-redis
+# YATUBE_CACHE_LOCATION переопределяет каталог, таблицу или адрес сервера.
+# Версия лент хранится в самом кэше, поэтому с общим бэкендом сброс
+# из одного воркера сразу виден всем остальным.
+CACHE_BACKEND = os.environ.get('YATUBE_CACHE', 'locmem')
+CACHE_LOCATION = os.environ.get('YATUBE_CACHE_LOCATION')
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'unique-snowflake',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'yatube_cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+}
+
+CACHES = {'default': dict(CACHE_BACKENDS[CACHE_BACKEND])}
+if CACHE_LOCATION:
+    CACHES['default']['LOCATION'] = CACHE_LOCATION
+
+# авторы, у которых подписчиков больше этого числа, не раскладывают посты
+# по лентам подписчиков: их посты подмешиваются в ленту при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+
+# страницы лент сбрасываются сменой версии при изменении постов,
+# поэтому срок жизни записей не ограничен
+FEED_CACHE_TIMEOUT = None
+
+# картинки постов при загрузке уменьшаются и перекодируются без метаданных
+# (posts.images); WebP, если Pillow собран без него - JPEG
+POST_IMAGE_MAX_SIZE = (1920, 1920)
+POST_IMAGE_MAX_PIXELS = 50 * 1000 * 1000
+POST_IMAGE_MAX_UPLOAD = 20 * 1024 * 1024
+POST_IMAGE_FORMAT = 'WEBP'
+POST_IMAGE_QUALITY = 82
+
+# миниатюры картинок постов готовятся в фоне после new_post и post_edit;
+# исполнитель: queue (очередь задач), thread, process или sync
+# (генерация прямо в запросе)
+POST_THUMBNAIL_SIZES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'card_640': ('640x226', {'crop': 'center', 'upscale': True}),
+    'card_320': ('320x113', {'crop': 'center', 'upscale': True}),
+}
+# варианты карточки для srcset и атрибут sizes: на узких экранах
+# карточка во всю ширину, иначе не шире колонки col-md-9
+POST_IMAGE_VARIANTS = ('card_320', 'card_640', 'card')
+POST_IMAGE_SIZES_ATTR = '(max-width: 767px) 100vw, 825px'
+# в разработке и тестах миниатюры строятся сразу, в production - через очередь
+POST_THUMBNAIL_EXECUTOR = 'sync'
+POST_THUMBNAIL_WORKERS = 2
+
+# побочные действия записи постов идут через очередь задач в БД,
+# её разбирает manage.py run_jobs; sync выполняет задачи сразу и
+# используется в разработке и тестах, production включает db
+JOB_QUEUE_MODE = 'sync'
+JOB_QUEUE_WORKERS = 4
+JOB_QUEUE_MAX_ATTEMPTS = 5
+# пауза перед повтором удваивается с каждой попыткой
+JOB_QUEUE_RETRY_DELAY = 10
+# не больше стольких задач одного имени одновременно на все воркеры
+JOB_QUEUE_CONCURRENCY = {
+    'thumbnails.generate': 2,
+}
+# задачи, которые выполняются дольше, считаются брошенными упавшим воркером
+JOB_QUEUE_STALE_AFTER = 10 * 60
+# сколько хранить выполненные задачи
+JOB_QUEUE_KEEP = 24 * 60 * 60
+
+# комментарии на странице поста и в каждой догружаемой странице
+COMMENTS_PER_PAGE = 20
+
+# метрики запросов по именам адресов: страница admin/stats/ для персонала
+# и /metrics в формате Prometheus для адресов из METRICS_ALLOWED_IPS
+REQUEST_METRICS = True
+METRICS_WINDOW = 5 * 60
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
@@ -0,0 +1,77 @@
+"""Продакшен-профиль: DJANGO_SETTINGS_MODULE=yatube.settings.production.
+
+Всё, что отличается между установками, берётся из окружения:
+  DJANGO_SECRET_KEY         - обязателен
+  YATUBE_ALLOWED_HOSTS      - имена сайта через запятую
+  YATUBE_DB_ENGINE          - бэкенд БД, по умолчанию yatube.db.sqlite3
+  YATUBE_DB_NAME            - имя базы или путь к файлу SQLite
+  YATUBE_DB_USER, YATUBE_DB_PASSWORD, YATUBE_DB_HOST, YATUBE_DB_PORT
+  YATUBE_DB_CONN_MAX_AGE    - сколько секунд держать соединение, по умолчанию 600
+  YATUBE_CACHE, YATUBE_CACHE_LOCATION - как в base, по умолчанию file
+  YATUBE_MEDIA_ROOT, YATUBE_MEDIA_URL, YATUBE_STATIC_ROOT
+
+При запуске wsgi.py прогоняет yatube.checks.enforce(): с медленными
+настройками разработки (DEBUG, соединение на запрос, шаблоны с диска,
+кэш в памяти процесса, синхронные задачи) приложение не стартует.
+"""
+import os
+
+from .base import *  # noqa: F401,F403
+from .base import (
+    CACHE_BACKENDS, DATABASES, MEDIA_ROOT, MEDIA_URL, SECRET_KEY,
+    STATIC_ROOT, TEMPLATES,
+)
+
+PRODUCTION = True
+
+DEBUG = False
+
+# без DJANGO_SECRET_KEY остаётся ключ разработки, и проверка при запуске упадёт
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+
+ALLOWED_HOSTS = [
+    host.strip()
+    for host in os.environ.get('YATUBE_ALLOWED_HOSTS', '').split(',')
+    if host.strip()
+]
+
+# соединение с БД живёт между запросами, а не открывается на каждый
+DATABASES = {
+    'default': {
+        'ENGINE': os.environ.get('YATUBE_DB_ENGINE', DATABASES['default']['ENGINE']),
+        'NAME': os.environ.get('YATUBE_DB_NAME', DATABASES['default']['NAME']),
+        'USER': os.environ.get('YATUBE_DB_USER', ''),
+        'PASSWORD': os.environ.get('YATUBE_DB_PASSWORD', ''),
+        'HOST': os.environ.get('YATUBE_DB_HOST', ''),
+        'PORT': os.environ.get('YATUBE_DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_DB_CONN_MAX_AGE', 600)),
+    }
+}
+
+# скомпилированные шаблоны хранятся в памяти процесса;
+# cached.Loader несовместим с APP_DIRS, поэтому загрузчики перечислены явно
+TEMPLATES = [dict(TEMPLATES[0], APP_DIRS=False)]
+TEMPLATES[0]['OPTIONS'] = dict(
+    TEMPLATES[0]['OPTIONS'],
+    loaders=[
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ],
+)
+
+# общий для всех воркеров кэш: версии лент и графа подписок видны всем сразу
+CACHE_BACKEND = os.environ.get('YATUBE_CACHE', 'file')
+CACHE_LOCATION = os.environ.get('YATUBE_CACHE_LOCATION')
+CACHES = {'default': dict(CACHE_BACKENDS[CACHE_BACKEND])}
+if CACHE_LOCATION:
+    CACHES['default']['LOCATION'] = CACHE_LOCATION
+
+# побочные действия записи и миниатюры - вне запроса, их разбирает run_jobs
+JOB_QUEUE_MODE = 'db'
+POST_THUMBNAIL_EXECUTOR = 'queue'
+
+MEDIA_ROOT = os.environ.get('YATUBE_MEDIA_ROOT', MEDIA_ROOT)
+MEDIA_URL = os.environ.get('YATUBE_MEDIA_URL', MEDIA_URL)
+STATIC_ROOT = os.environ.get('YATUBE_STATIC_ROOT', STATIC_ROOT)
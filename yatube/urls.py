@@ -20,10 +20,15 @@ from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
 
+from posts import views as posts_views
+
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
  
 urlpatterns = [
+    # метрики запросов: до admin/, иначе адрес перехватит админка
+        path('admin/stats/', posts_views.request_stats, name='request_stats'),
+        path('metrics', posts_views.prometheus_metrics, name='metrics'),
     # раздел администратора
         path('admin/', admin.site.urls),
         # flatpages
@@ -31,6 +36,8 @@ urlpatterns = [
         # регистрация и авторизация
         path('auth/', include('users.urls')),
         path('auth/', include('django.contrib.auth.urls')),
+        # JSON API лент: до posts.urls, где <username>/ перехватил бы api/
+        path('api/v1/', include('posts.api_urls')),
         # импорт из приложения posts
         path('', include('posts.urls')),
      
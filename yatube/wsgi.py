@@ -5,6 +5,8 @@ It exposes the WSGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
+
+Продакшен: DJANGO_SETTINGS_MODULE=yatube.settings.production.
 """
 
 import os
@@ -14,3 +16,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# в продакшене не стартуем с медленными настройками разработки
+from yatube.checks import enforce  # noqa: E402
+
+enforce()